@@ -0,0 +1,148 @@
+/*
+ * runstat: запускает программу и печатает в stderr потраченные ресурсы
+ *
+ *   runstat [-c cpu_seconds] [-w wall_seconds] -- command [args...]
+ *
+ * Строка статистики совместима с прежним выводом GNU time ("mem: %M;time: %e"):
+ *   mem: <пиковый RSS, КБ>;time: <астрономическое время, с>;user: <мкс>;sys: <мкс>;wall: <мкс>
+ *
+ * Программа запускается в своей группе процессов; при превышении астрономического времени
+ * SIGKILL получает вся группа.
+ *
+ * Код возврата как у timeout: 124 при превышении ограничения времени,
+ * 128 + номер сигнала, если программа завершена сигналом, иначе код программы.
+ */
+#include <errno.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/resource.h>
+#include <sys/time.h>
+#include <sys/wait.h>
+#include <time.h>
+#include <unistd.h>
+
+#define EXIT_TIMEOUT 124
+#define EXIT_FAILURE_RUNSTAT 125
+
+static pid_t child;
+static volatile sig_atomic_t timed_out = 0;
+
+static void on_alarm(int sig)
+{
+    (void)sig;
+    timed_out = 1;
+    /* вся группа процессов: bash -c, порожденные процессы, хост dotnet */
+    kill(-child, SIGKILL);
+}
+
+static long usec(struct timeval tv)
+{
+    return tv.tv_sec * 1000000L + tv.tv_usec;
+}
+
+static int usage(void)
+{
+    fprintf(stderr, "usage: runstat [-c cpu_seconds] [-w wall_seconds] -- command [args...]\n");
+    return EXIT_FAILURE_RUNSTAT;
+}
+
+int main(int argc, char *argv[])
+{
+    double cpu_limit = 0, wall_limit = 0;
+    int opt;
+    while ((opt = getopt(argc, argv, "+c:w:")) != -1) {
+        switch (opt) {
+        case 'c':
+            cpu_limit = strtod(optarg, NULL);
+            break;
+        case 'w':
+            wall_limit = strtod(optarg, NULL);
+            break;
+        default:
+            return usage();
+        }
+    }
+    if (optind >= argc)
+        return usage();
+
+    struct timespec start, end;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+
+    child = fork();
+    if (child < 0) {
+        perror("fork");
+        return EXIT_FAILURE_RUNSTAT;
+    }
+    if (child == 0) {
+        /* своя группа процессов, как у timeout: по истечении времени завершается целиком */
+        setpgid(0, 0);
+        if (cpu_limit > 0) {
+            /* ITIMER_PROF сохраняется при exec и считает user + sys точно,
+               RLIMIT_CPU в целых секундах - на случай, если SIGPROF перехвачен */
+            struct itimerval timer;
+            memset(&timer, 0, sizeof(timer));
+            timer.it_value.tv_sec = (long)cpu_limit;
+            timer.it_value.tv_usec = (long)((cpu_limit - (long)cpu_limit) * 1000000);
+            if (timer.it_value.tv_sec == 0 && timer.it_value.tv_usec == 0)
+                timer.it_value.tv_usec = 1;
+            setitimer(ITIMER_PROF, &timer, NULL);
+
+            struct rlimit rl;
+            rl.rlim_cur = (rlim_t)cpu_limit + 1;
+            rl.rlim_max = rl.rlim_cur + 1;
+            setrlimit(RLIMIT_CPU, &rl);
+        }
+        execvp(argv[optind], argv + optind);
+        int error = errno;
+        perror(argv[optind]);
+        _exit(error == ENOENT ? 127 : 126);
+    }
+    /* и в родителе: группа должна существовать до первого SIGALRM */
+    setpgid(child, child);
+
+    if (wall_limit > 0) {
+        struct sigaction sa;
+        memset(&sa, 0, sizeof(sa));
+        sa.sa_handler = on_alarm;
+        sigaction(SIGALRM, &sa, NULL);
+
+        struct itimerval timer;
+        memset(&timer, 0, sizeof(timer));
+        timer.it_value.tv_sec = (long)wall_limit;
+        timer.it_value.tv_usec = (long)((wall_limit - (long)wall_limit) * 1000000);
+        if (timer.it_value.tv_sec == 0 && timer.it_value.tv_usec == 0)
+            timer.it_value.tv_usec = 1;
+        setitimer(ITIMER_REAL, &timer, NULL);
+    }
+
+    int status;
+    struct rusage ru;
+    while (wait4(child, &status, 0, &ru) < 0) {
+        if (errno != EINTR) {
+            perror("wait4");
+            return EXIT_FAILURE_RUNSTAT;
+        }
+    }
+    clock_gettime(CLOCK_MONOTONIC, &end);
+
+    long user = usec(ru.ru_utime);
+    long sys = usec(ru.ru_stime);
+    long wall = (end.tv_sec - start.tv_sec) * 1000000L + (end.tv_nsec - start.tv_nsec) / 1000;
+    fprintf(stderr, "mem: %ld;time: %.6f;user: %ld;sys: %ld;wall: %ld\n",
+        ru.ru_maxrss, wall / 1000000.0, user, sys, wall);
+
+    if (timed_out)
+        return EXIT_TIMEOUT;
+    if (cpu_limit > 0 && user + sys > (long)(cpu_limit * 1000000))
+        return EXIT_TIMEOUT;
+    if (WIFEXITED(status))
+        return WEXITSTATUS(status);
+    if (WIFSIGNALED(status)) {
+        if (cpu_limit > 0 && (WTERMSIG(status) == SIGXCPU || WTERMSIG(status) == SIGPROF))
+            return EXIT_TIMEOUT;
+        return 128 + WTERMSIG(status);
+    }
+    return EXIT_FAILURE_RUNSTAT;
+}
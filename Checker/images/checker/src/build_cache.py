@@ -0,0 +1,149 @@
+from globals import *
+from collections import OrderedDict
+import hashlib
+import shutil
+import threading
+import time
+
+logger = log("build_cache")
+
+# Кэш собранных артефактов: ключ - (язык, образ, команды сборки, исходник)
+BUILD_CACHE = os.environ.get("BUILD_CACHE") or path_join(starter_temp(), "build_cache")
+BUILD_CACHE_SIZE = int(os.environ.get("BUILD_CACHE_SIZE", "1024")) * 1024 * 1024
+
+HITS = "hits"
+MISSES = "misses"
+
+def dir_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+class BuildCache:
+    def __init__(self, path: str, max_size: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # key -> size, от старых к новым
+        self.size = 0
+        self.statistics = {
+            HITS: 0,
+            MISSES: 0
+        }
+        if self.enabled():
+            self.load()
+
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def load(self):
+        os.makedirs(self.path, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.path):
+            entry_path = path_join(self.path, name)
+            if name.startswith("tmp"):
+                shutil.rmtree(entry_path, ignore_errors=True)
+            elif os.path.isdir(entry_path):
+                entries.append((os.stat(entry_path).st_mtime, name, dir_size(entry_path)))
+        entries.sort()
+        for _, name, size in entries:
+            self.entries[name] = size
+            self.size += size
+        self.evict()
+        logger.info("entries: " + str(len(self.entries)) + ", size: " + str(self.size))
+
+    def key(self, options: dict) -> str:
+        h = hashlib.sha256()
+        for value in [options[LANGUAGE], options["image_name"], "\n".join(options["commands"]), options[SOURCE]]:
+            h.update(value.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def evict(self):
+        # вызывается под self.lock
+        while self.size > self.max_size and len(self.entries) > 0:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            shutil.rmtree(path_join(self.path, key), ignore_errors=True)
+            logger.debug("evict " + key)
+
+    def restore(self, options: dict) -> bool:
+        if not self.enabled():
+            return False
+
+        key = self.key(options)
+        entry_path = path_join(self.path, key)
+        self.lock.acquire()
+        try:
+            found = key in self.entries
+            if found:
+                self.entries.move_to_end(key)
+                self.statistics[HITS] += 1
+            else:
+                self.statistics[MISSES] += 1
+        finally:
+            self.lock.release()
+        if not found:
+            return False
+
+        bin_path = path_join(options[STARTER_TEMP], options["bin_path"])
+        try:
+            shutil.copytree(entry_path, bin_path, dirs_exist_ok=True)
+            os.utime(entry_path)
+        except OSError as e:
+            # запись могла быть вытеснена между проверкой и копированием
+            logger.warning("restore " + key + ": " + str(e))
+            return False
+        logger.debug("hit " + key)
+        return True
+
+    def store(self, options: dict):
+        if not self.enabled():
+            return
+
+        key = self.key(options)
+        entry_path = path_join(self.path, key)
+        bin_path = path_join(options[STARTER_TEMP], options["bin_path"])
+        tmp_path = path_join(self.path, "tmp" + key + "_" + str(threading.get_ident()) + "_" + str(time.monotonic_ns()))
+        try:
+            shutil.copytree(bin_path, tmp_path)
+            size = dir_size(tmp_path)
+            self.lock.acquire()
+            try:
+                if key in self.entries or size > self.max_size:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                    return
+                os.rename(tmp_path, entry_path)
+                self.entries[key] = size
+                self.size += size
+                self.evict()
+            finally:
+                self.lock.release()
+            logger.debug("store " + key + ", size: " + str(size))
+        except OSError as e:
+            logger.warning("store " + key + ": " + str(e))
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def get_statistics(self) -> dict:
+        self.lock.acquire()
+        try:
+            return dict(self.statistics, entries=len(self.entries), size=self.size)
+        finally:
+            self.lock.release()
+
+
+cache = BuildCache(BUILD_CACHE, BUILD_CACHE_SIZE)
+
+def restore(options: dict) -> bool:
+    return cache.restore(options)
+
+def store(options: dict):
+    cache.store(options)
+
+def get_statistics() -> dict:
+    return cache.get_statistics()
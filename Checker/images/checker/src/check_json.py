@@ -1,4 +1,5 @@
 from globals import *
+import problems
 
 class CheckJsonException(ValueError):
     def __init__(self, message: str) -> None:
@@ -7,6 +8,8 @@ class CheckJsonException(ValueError):
 def check_object(options: dict, name: str) -> None:
     if not options.get(name):
         raise CheckJsonException("Need " + name + " object, but not found")
+    if not isinstance(options[name], dict):
+        raise CheckJsonException("Need " + name + " object, but found " + type(options[name]).__name__)
 
 def check_prop(options: dict, name: str) -> None:
     if not options.get(name):
@@ -18,7 +21,102 @@ def check_source(options: dict, name: str) -> None:
     check_prop(source, LANGUAGE)
     check_prop(source, SOURCE)
 
+def check_list(options: dict, name: str) -> None:
+    if not options.get(name):
+        raise CheckJsonException("Need " + name + " list, but not found")
+    if not isinstance(options[name], list):
+        raise CheckJsonException("Need " + name + " list, but found " + type(options[name]).__name__)
+
+def check_priority(options: dict) -> None:
+    priority = options.get(PRIORITY, DEFAULT_PRIORITY)
+    if not isinstance(priority, str) or not priority in PRIORITIES:
+        raise CheckJsonException("Unknown " + PRIORITY + " \"" + str(priority) + "\", expected one of: " + ", ".join(PRIORITIES))
+
+def check_shards(options: dict) -> None:
+    shards = options.get(SHARDS, 1)
+    if not isinstance(shards, int) or isinstance(shards, bool) or shards < 1:
+        raise CheckJsonException("Need positive integer " + SHARDS + " property")
+
+def check_pipeline(options: dict) -> None:
+    pipeline = options.get(PIPELINE, SEPARATE)
+    if not pipeline in [SEPARATE, FUSED]:
+        raise CheckJsonException("Unknown " + PIPELINE + " \"" + str(pipeline) + "\", expected " + SEPARATE + " or " + FUSED)
+
+def check_timeout_mode(options: dict) -> None:
+    mode = options.get(TIMEOUT_MODE, WALL)
+    if not mode in [WALL, CPU]:
+        raise CheckJsonException("Unknown " + TIMEOUT_MODE + " \"" + str(mode) + "\", expected " + WALL + " or " + CPU)
+
+def check_number(options: dict, name: str) -> None:
+    value = options.get(name, 0)
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+        raise CheckJsonException("Need non-negative number " + name + " property")
+
+def check_samples(options: dict) -> None:
+    check_list(options, SAMPLES)
+    for sample in options[SAMPLES]:
+        if isinstance(sample, dict):
+            if not isinstance(sample.get(INPUT), str) or not isinstance(sample.get(OUTPUT, ""), str):
+                raise CheckJsonException("Need " + INPUT + " and " + OUTPUT + " strings in sample object")
+        elif not isinstance(sample, str):
+            raise CheckJsonException("Need sample string or object, but found " + type(sample).__name__)
+
+def check_checker(options: dict) -> None:
+    # проверка - программа (language, source) или встроенная (compare)
+    check_object(options, CHECKER)
+    compare = options[CHECKER].get(COMPARE)
+    if compare is None:
+        check_source(options, CHECKER)
+        return
+    if not compare in COMPARE_MODES:
+        raise CheckJsonException("Unknown " + COMPARE + " \"" + str(compare) + "\", expected one of: " + ", ".join(COMPARE_MODES))
+    check_number(options[CHECKER], ABS_EPS)
+    check_number(options[CHECKER], REL_EPS)
+    for sample in options[SAMPLES]:
+        if not isinstance(sample, dict) or not OUTPUT in sample:
+            raise CheckJsonException("Need " + OUTPUT + " in every sample for " + COMPARE + " checker")
+
+def check_output_limit(options: dict) -> None:
+    try:
+        limit = parse_size(options.get(OUTPUT_LIMIT, 0))
+    except ValueError:
+        limit = -1
+    if limit is None or limit < 0:
+        raise CheckJsonException("Need " + OUTPUT_LIMIT + " size, e.g. 16m, or 0 for no limit")
+
 def check(options: dict) -> None:
     check_source(options, TESTEE)
-    check_source(options, CHECKER)
-    check_object(options, SAMPLES)
+    check_timeout_mode(options[TESTEE])
+    check_output_limit(options[TESTEE])
+    if PROBLEM in options:
+        if not isinstance(options[PROBLEM], str) or problems.get(options[PROBLEM]) is None:
+            raise CheckJsonException("Problem " + str(options[PROBLEM]) + " not found")
+    else:
+        check_samples(options)
+        check_checker(options)
+    check_priority(options)
+    check_shards(options)
+    check_pipeline(options)
+
+def check_batch(options: dict) -> None:
+    check_samples(options)
+    check_checker(options)
+    check_list(options, TESTEES)
+    for testee in options[TESTEES]:
+        if not isinstance(testee, dict):
+            raise CheckJsonException("Need " + TESTEE + " object in " + TESTEES + ", but found " + type(testee).__name__)
+        check_source({ TESTEE: testee }, TESTEE)
+        check_timeout_mode(testee)
+        check_output_limit(testee)
+    check_priority(options)
+    check_shards(options)
+    check_pipeline(options)
+
+def check_problem(options: dict) -> None:
+    check_samples(options)
+    check_checker(options)
+    if not isinstance(options.get(LIMITS, {}), dict):
+        raise CheckJsonException("Need " + LIMITS + " object")
+    check_timeout_mode(options.get(LIMITS, {}))
+    check_output_limit(options.get(LIMITS, {}))
+    check_priority(options)
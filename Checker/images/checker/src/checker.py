@@ -1,75 +1,164 @@
 from globals import *
 from docker.types import Mount
+import heapq
+import runstat
+import samplestore
 
-def prepare_testee(options: dict, samples: dict) -> str:
+# Каталог входных данных примеров, подключается одним монтированием только для чтения
+INPUT_DIR = "in"
+# Выводы тестируемой программы (каталог wrk) в фазе проверки, только для чтения
+OUTPUT_DIR = "out"
+# Рабочий каталог проверки в каталоге задачи
+CHECKER_WORK_DIR = "chk"
+
+def checker_spec(options: dict) -> dict:
+    # описание проверки из запроса, без служебных полей
+    if COMPARE in options:
+        return {name: options[name] for name in [COMPARE, ABS_EPS, REL_EPS] if name in options}
+    return {
+        LANGUAGE: options[LANGUAGE],
+        SOURCE: options[SOURCE]
+    }
+
+def sample_name(prefix: str, i: int) -> str:
+    return prefix + f"{i:03}.txt"
+
+def samples_dir(options: dict) -> str:
+    # каталог с input*.txt; общий у задач пакета, иначе свой у задачи
+    return options.get(SAMPLES_DIR) or path_join(options[DOCKER_TEMP], INPUT_DIR)
+
+def sample_input(sample) -> str:
+    # пример - строка входных данных или объект {"input": ..., "output": ...}
+    return sample[INPUT] if isinstance(sample, dict) else sample
+
+def sample_output(sample) -> str:
+    return sample.get(OUTPUT) if isinstance(sample, dict) else None
+
+def answer_path(options: dict, i: int) -> str:
+    # ожидаемый вывод на стороне сервиса, для встроенных проверок
+    path = options.get(STARTER_SAMPLES_DIR) or path_join(options[STARTER_TEMP], INPUT_DIR)
+    return path_join(path, sample_name("answer", i))
+
+def output_path(options: dict, i: int) -> str:
+    return path_join(path_join(options[STARTER_TEMP], "wrk"), sample_name("output", i))
+
+def write_samples(path: str, samples: list):
+    # жесткие ссылки на хранилище: содержимое записывается на диск один раз
+    i = 1
+    for sample in samples:
+        samplestore.link(sample_input(sample), path_join(path, sample_name("input", i)))
+        output = sample_output(sample)
+        if not output is None:
+            samplestore.link(output, path_join(path, sample_name("answer", i)))
+        i += 1
+
+def mount_samples(options: dict, target: str):
+    options[MOUNTS].append(Mount(target, samples_dir(options), type="bind", read_only=True))
+
+def protect_samples(options: dict):
+    # примеры в каталоге задачи и общем каталоге пакета - жесткие ссылки на хранилище:
+    # сборка монтирует каталог целиком на запись, поэтому они перекрываются монтированием только для чтения
+    for name in [INPUT_DIR, "samples"]:
+        if os.path.isdir(path_join(options[STARTER_TEMP], name)):
+            options[MOUNTS].append(Mount(path_join("/usr/src", name), path_join(options[DOCKER_TEMP], name), type="bind", read_only=True))
+
+def prepare_samples(options: dict, samples: list):
+    os.makedirs(path_join(options[STARTER_TEMP], "wrk"))
+    if not options.get(SAMPLES_DIR):
+        starter_input_tmp = path_join(options[STARTER_TEMP], INPUT_DIR)
+        os.makedirs(starter_input_tmp)
+        write_samples(starter_input_tmp, samples)
+
+def split_samples(samples: list, count: int, order: list = None) -> list:
+    # жадное распределение: самые долгие примеры первыми, каждый - в наименее загруженную часть
+    # ожидаемая стоимость примера - размер входных данных;
+    # внутри части примеры запускаются в порядке order
+    sizes = [len(sample_input(sample)) for sample in samples]
+    by_size = sorted(range(1, len(samples) + 1), key=lambda i: sizes[i - 1], reverse=True)
+    count = max(1, min(count, len(by_size)))
+    shards = [[] for _ in range(count)]
+    load = [(0, k) for k in range(count)]
+    for i in by_size:
+        cost, k = heapq.heappop(load)
+        shards[k].append(i)
+        heapq.heappush(load, (cost + sizes[i - 1] + 1, k))
+    if order:
+        position = {i: k for k, i in enumerate(order)}
+        for shard in shards:
+            shard.sort(key=lambda i: position[i])
+    return shards
+
+def prepare_testee(options: dict, indexes: list, shard: str = "") -> str:
     options[MOUNTS] = mounts = options.get(MOUNTS, [])
 
     docker_tmp = options[DOCKER_TEMP]
     starter_tmp = options[STARTER_TEMP]
-    starter_wrk_tmp = path_join(starter_tmp, "wrk")
-    os.makedirs(starter_wrk_tmp)
-    docker_wrk_tmp = path_join(docker_tmp, "wrk")
-
-    mounts.append(Mount("/usr/src", starter_wrk_tmp, type="bind", read_only=False))
+    if shard:
+        # у каждой части свой рабочий каталог, входные данные общие
+        os.makedirs(path_join(starter_tmp, "wrk" + shard))
+    mounts.append(Mount("/usr/src", path_join(docker_tmp, "wrk" + shard), type="bind", read_only=False))
+    mount_samples(options, path_join("/usr/src", INPUT_DIR))
+    runstat.mount(options)
 
     cmd = ["#!/bin/bash"]
     options["commands"] = cmd
-    i = 1
-    for sample in samples:
-        input_name = "input" + f"{i:03}.txt"
-        with open(path_join(starter_wrk_tmp, input_name), "x", newline="\n") as f:
-            f.write(sample)
-            mounts.append(Mount(path_join("/usr/src", input_name), path_join(docker_wrk_tmp, input_name), type="bind", read_only=True))
+    for i in indexes:
+        input_name = sample_name("input", i)
 
         cmd.append("echo \"sample: " + str(i) + "\"")
-        cmd_debug(cmd, "ln -sf " + input_name + " input.txt")
-        cmd_debug(cmd, "cat input.txt | time --format=\"mem: %M;time: %e\" --output=stats.txt -q timeout " + str(options[TIMEOUT]) + " " + options[CMD] + " >> output.txt")
-        cmd.append("retVal=$?")
-        cmd.append("cat stats.txt")
+        cmd_debug(cmd, "ln -sf " + INPUT_DIR + "/" + input_name + " input.txt")
+        run = runstat.command(options, options[CMD])
+        cmd_debug(cmd, run[0])
+        cmd += run[1:]
         cmd.append("if [ $retVal -ne 0 ]; then")
         cmd.append("  echo \"testee error\"")
         cmd.append("  exit $retVal")
         cmd.append("fi")
-        cmd_debug(cmd, "mv output.txt output" + f"{i:03}.txt")
-        i += 1
+        cmd_debug(cmd, "mv output.txt " + sample_name("output", i))
 
     s = "\n".join(cmd)
-    command_filename = "run_testee.sh"
+    command_filename = "run_testee" + shard + ".sh"
     with open(path_join(starter_tmp, command_filename), "x", newline="\n") as f:
         f.write(s)
         mounts.append(Mount(path_join("/usr/src", command_filename), path_join(docker_tmp, command_filename), type="bind", read_only=True))
     options["command"] = command_filename
     options[READONLY] = True
+
+def collect_outputs(options: dict, indexes: list, shard: str):
+    starter_tmp = options[STARTER_TEMP]
+    for i in indexes:
+        output_name = sample_name("output", i)
+        src = path_join(path_join(starter_tmp, "wrk" + shard), output_name)
+        if os.path.exists(src):
+            os.replace(src, path_join(path_join(starter_tmp, "wrk"), output_name))
     
-def prepare_checker(options: dict, samples: dict) -> str:
+def prepare_checker(options: dict, indexes: list) -> str:
     options[MOUNTS] = mounts = options.get(MOUNTS, [])
 
     docker_tmp = options[DOCKER_TEMP]
     starter_tmp = options[STARTER_TEMP]
-    starter_wrk_tmp = path_join(starter_tmp, "wrk")
-    mounts.append(Mount("/usr/src", starter_wrk_tmp, type="bind", read_only=False))
-    docker_wrk_tmp = path_join(docker_tmp, "wrk")
+    # проверка пишет в свой каталог, выводы программы ей доступны только для чтения
+    os.makedirs(path_join(starter_tmp, CHECKER_WORK_DIR))
+    mounts.append(Mount("/usr/src", path_join(docker_tmp, CHECKER_WORK_DIR), type="bind", read_only=False))
+    mounts.append(Mount(path_join("/usr/src", OUTPUT_DIR), path_join(docker_tmp, "wrk"), type="bind", read_only=True))
+    mount_samples(options, path_join("/usr/src", INPUT_DIR))
 
     cmd = ["#!/bin/bash"]
     options["commands"] = cmd
     timeout = options.get(TIMEOUT, 360)
-    i = 1
-    for _ in samples:
-        input_name = "input" + f"{i:03}.txt"
-        mounts.append(Mount(path_join("/usr/src", input_name), path_join(docker_wrk_tmp, input_name), type="bind", read_only=True))
-        output_name = "output" + f"{i:03}.txt"
-        mounts.append(Mount(path_join("/usr/src", output_name), path_join(starter_wrk_tmp, output_name), type="bind", read_only=True))
+    for i in indexes:
+        input_name = sample_name("input", i)
+        output_name = sample_name("output", i)
 
         cmd.append("echo \"sample: " + str(i) + "\"")
-        cmd_debug(cmd, "ln -sf " + input_name + " input.txt")
-        cmd_debug(cmd, "ln -sf " + output_name + " output.txt")
+        cmd_debug(cmd, "ln -sf " + INPUT_DIR + "/" + input_name + " input.txt")
+        cmd_debug(cmd, "ln -sf " + OUTPUT_DIR + "/" + output_name + " output.txt")
         cmd_debug(cmd, "timeout " + str(timeout) + " " + options[CMD])
         cmd.append("retVal=$?")
         cmd.append("if [ $retVal -ne 0 ]; then")
         cmd.append("  echo \"checker error\"")
         cmd.append("  exit retVal=$?")
         cmd.append("fi")
-        i += 1
 
     s = "\n".join(cmd)
     command_filename = "run_checker.sh"
@@ -79,3 +168,74 @@ def prepare_checker(options: dict, samples: dict) -> str:
     options["command"] = command_filename
     options[READONLY] = True
 
+
+
+def prepare_fused(testee_options: dict, checker_options: dict, indexes: list) -> str:
+    # тестируемая программа и проверка в одном контейнере:
+    # проверка запускается сразу после каждого примера от root в закрытом каталоге chk,
+    # тестируемая программа - от FUSED_USER и в chk попасть не может;
+    # вывод примера переходит к root до запуска проверки
+    options = testee_options
+    options[MOUNTS] = mounts = options.get(MOUNTS, [])
+
+    docker_tmp = options[DOCKER_TEMP]
+    starter_tmp = options[STARTER_TEMP]
+    starter_wrk_tmp = path_join(starter_tmp, "wrk")
+    docker_wrk_tmp = path_join(docker_tmp, "wrk")
+    os.chmod(starter_wrk_tmp, 0o1777)
+    os.makedirs(path_join(starter_wrk_tmp, "chk"))
+    os.chmod(path_join(starter_wrk_tmp, "chk"), 0o700)
+
+    mounts.append(Mount("/usr/src", docker_wrk_tmp, type="bind", read_only=False))
+    mount_samples(options, path_join("/usr/src", INPUT_DIR))
+    runstat.mount(options)
+    for mount in checker_options[MOUNTS]:
+        mounts.append(Mount(mount["Target"].replace("/usr/src/", "/usr/src/chk/", 1), mount["Source"], type="bind", read_only=True))
+
+    cmd = ["#!/bin/bash"]
+    options["commands"] = cmd
+    checker_timeout = checker_options.get(TIMEOUT, 360)
+    user = "setpriv --reuid=" + FUSED_USER + " --regid=" + FUSED_USER + " --clear-groups "
+    for i in indexes:
+        input_name = sample_name("input", i)
+        output_name = sample_name("output", i)
+
+        cmd.append("echo \"sample: " + str(i) + "\"")
+        cmd_debug(cmd, "ln -sf " + INPUT_DIR + "/" + input_name + " input.txt")
+        run = runstat.command(options, user + options[CMD])
+        cmd_debug(cmd, run[0])
+        cmd += run[1:]
+        cmd.append("if [ $retVal -ne 0 ]; then")
+        cmd.append("  echo \"testee error\"")
+        cmd.append("  exit $retVal")
+        cmd.append("fi")
+        # фоновые процессы программы не переживают пример: kill -1 от FUSED_USER получают все его процессы
+        # (pkill есть не во всех образах), после чего вывод недоступен программе для записи
+        cmd_debug(cmd, user + "bash -c \"kill -KILL -1\" 2>/dev/null")
+        cmd_debug(cmd, "mv output.txt " + output_name)
+        cmd_debug(cmd, "chown -h root:root " + output_name)
+        cmd_debug(cmd, "[ -L " + output_name + " ] || chmod 444 " + output_name)
+
+        cmd.append("cd chk")
+        cmd_debug(cmd, "ln -sf ../" + INPUT_DIR + "/" + input_name + " input.txt")
+        cmd_debug(cmd, "ln -sf ../" + output_name + " output.txt")
+        cmd_debug(cmd, "timeout " + str(checker_timeout) + " " + checker_options[CMD])
+        cmd.append("retVal=$?")
+        cmd.append("cd ..")
+        cmd.append("if [ $retVal -eq 124 ]; then")
+        cmd.append("  echo \"checker timeout\"")
+        cmd.append("  exit " + str(EXIT_CHECKER_TIMEOUT))
+        cmd.append("fi")
+        cmd.append("if [ $retVal -ne 0 ]; then")
+        cmd.append("  echo \"wrong answer\"")
+        cmd.append("  exit " + str(EXIT_WRONG_ANSWER))
+        cmd.append("fi")
+
+    s = "\n".join(cmd)
+    command_filename = "run_fused.sh"
+    with open(path_join(starter_tmp, command_filename), "x", newline="\n") as f:
+        f.write(s)
+        mounts.append(Mount(path_join("/usr/src", command_filename), path_join(docker_tmp, command_filename), type="bind", read_only=True))
+    options["command"] = command_filename
+    options[READONLY] = True
+    options[USER] = "root"
@@ -0,0 +1,250 @@
+from globals import *
+import math
+import stat
+
+# Встроенные проверки: вывод программы сравнивается с ожидаемым прямо в сервисе,
+# без сборки и контейнера проверки. Файлы читаются по частям, целиком в памяти не держатся,
+# длинные строки и токены тоже сравниваются частями.
+
+CHUNK_SIZE = 65536
+# Длина токена или строки в сообщении об ошибке
+SHOW_LENGTH = 64
+
+DEFAULT_ABS_EPS = 1e-6
+DEFAULT_REL_EPS = 1e-6
+
+def show(value: bytes) -> str:
+    text = value.decode("utf-8", errors="replace")
+    if len(text) > SHOW_LENGTH:
+        text = text[:SHOW_LENGTH] + "..."
+    return "\"" + text + "\""
+
+def chunks(f):
+    while True:
+        data = f.read(CHUNK_SIZE)
+        if not data:
+            return
+        yield data
+
+def repeat(value: bytes, count: int):
+    while count > 0:
+        n = min(count, CHUNK_SIZE)
+        yield value * n
+        count -= n
+
+def token_chunks(f):
+    # токены через один пробел, без пробельных символов в начале и в конце
+    started = False
+    space = False
+    for data in chunks(f):
+        parts = data.split()
+        if not parts:
+            space = True
+            continue
+        if started and (space or data[:1].isspace()):
+            yield b" "
+        started = True
+        space = data[-1:].isspace()
+        yield b" ".join(parts)
+
+def line_chunks(f):
+    # строки без пробельных символов в конце через "\n", пустые строки в конце файла не учитываются.
+    # Пробельные символы в строке не накапливаются: если за ними есть текст,
+    # они перечитываются из файла по смещению
+    fd = f.fileno()
+    offset = 0
+    newlines = 0
+    space_start = None
+    space_length = 0
+    for data in chunks(f):
+        parts = data.split(b"\n")
+        position = offset
+        for k, part in enumerate(parts):
+            if k > 0:
+                newlines += 1
+                space_start = None
+                space_length = 0
+            stripped = part.rstrip()
+            if stripped:
+                yield from repeat(b"\n", newlines)
+                newlines = 0
+                while space_length > 0:
+                    piece = os.pread(fd, min(space_length, CHUNK_SIZE), space_start)
+                    if not piece:
+                        break
+                    yield piece
+                    space_start += len(piece)
+                    space_length -= len(piece)
+                yield stripped
+                space_start = None
+                space_length = 0
+            if len(stripped) < len(part):
+                if space_start is None:
+                    space_start = position + len(stripped)
+                space_length += len(part) - len(stripped)
+            position += len(part) + 1
+        offset += len(data)
+
+
+class Items:
+    # элементы потока, разделенные байтом sep; элемент читается частями не длиннее limit
+    def __init__(self, stream, sep: bytes) -> None:
+        self.stream = stream
+        self.sep = sep
+        self.buffer = b""
+        self.position = 0
+        self.state = "start" # start, item, between, end
+
+    def fill(self) -> bool:
+        if self.position < len(self.buffer):
+            return True
+        self.buffer = next(self.stream, b"")
+        self.position = 0
+        return len(self.buffer) > 0
+
+    def next(self) -> bool:
+        # переход к следующему элементу, остаток текущего пропускается
+        while self.state == "item":
+            self.read(CHUNK_SIZE)
+        if self.state == "start":
+            self.state = "item" if self.fill() else "end"
+        elif self.state == "between":
+            self.state = "item"
+        return self.state == "item"
+
+    def read(self, limit: int) -> tuple:
+        # (часть элемента, элемент закончился)
+        if self.state != "item":
+            return b"", True
+        data = b""
+        while len(data) < limit:
+            if not self.fill():
+                self.state = "end"
+                return data, True
+            stop = min(len(self.buffer), self.position + limit - len(data))
+            i = self.buffer.find(self.sep, self.position, stop)
+            if i >= 0:
+                data += self.buffer[self.position:i]
+                self.position = i + 1
+                self.state = "between"
+                return data, True
+            data += self.buffer[self.position:stop]
+            self.position = stop
+        if not self.fill():
+            self.state = "end"
+            return data, True
+        if self.buffer[self.position:self.position + 1] == self.sep:
+            self.position += 1
+            self.state = "between"
+            return data, True
+        return data, False
+
+def compare_exact(output, answer, options: dict) -> str:
+    position = 0
+    while True:
+        got = output.read(CHUNK_SIZE)
+        expected = answer.read(CHUNK_SIZE)
+        if got != expected:
+            n = min(len(got), len(expected))
+            i = next((k for k in range(n) if got[k] != expected[k]), n)
+            return "differ at byte " + str(position + i + 1)
+        if not got:
+            return None
+        position += len(got)
+
+def compare_item(got: Items, expected: Items, equal) -> tuple:
+    # (совпали, начало элемента вывода, начало ожидаемого элемента);
+    # элементы длиннее CHUNK_SIZE сравниваются по частям точно
+    a, got_end = got.read(CHUNK_SIZE)
+    b, expected_end = expected.read(CHUNK_SIZE)
+    if got_end and expected_end:
+        return equal(a, b), a, b
+    heads = (a, b)
+    while a == b and not got_end and not expected_end:
+        a, got_end = got.read(CHUNK_SIZE)
+        b, expected_end = expected.read(CHUNK_SIZE)
+    return (a == b and got_end and expected_end,) + heads
+
+def compare_sequence(got: Items, expected: Items, name: str, equal) -> str:
+    i = 0
+    while expected.next():
+        i += 1
+        if not got.next():
+            b, _ = expected.read(CHUNK_SIZE)
+            return name + " " + str(i) + ": expected " + show(b) + ", found end of output"
+        same, a, b = compare_item(got, expected, equal)
+        if not same:
+            return name + " " + str(i) + ": expected " + show(b) + ", found " + show(a)
+    if got.next():
+        a, _ = got.read(CHUNK_SIZE)
+        return name + " " + str(i + 1) + ": expected end of output, found " + show(a)
+    return None
+
+def tokens(f) -> Items:
+    return Items(token_chunks(f), b" ")
+
+def lines(f) -> Items:
+    return Items(line_chunks(f), b"\n")
+
+def compare_tokens(output, answer, options: dict) -> str:
+    return compare_sequence(tokens(output), tokens(answer), "token", lambda a, b: a == b)
+
+def compare_lines(output, answer, options: dict) -> str:
+    return compare_sequence(lines(output), lines(answer), "line", lambda a, b: a == b)
+
+def parse_float(token: bytes) -> float:
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+def compare_numeric(output, answer, options: dict) -> str:
+    # числа сравниваются с абсолютной или относительной погрешностью, остальные токены - точно
+    abs_eps = float(options.get(ABS_EPS, DEFAULT_ABS_EPS))
+    rel_eps = float(options.get(REL_EPS, DEFAULT_REL_EPS))
+
+    def equal(got: bytes, expected: bytes) -> bool:
+        if got == expected:
+            return True
+        b = parse_float(expected)
+        a = parse_float(got)
+        if a is None or b is None:
+            return False
+        diff = abs(a - b)
+        return diff <= abs_eps or diff <= rel_eps * abs(b)
+
+    return compare_sequence(tokens(output), tokens(answer), "token", equal)
+
+COMPARATORS = {
+    EXACT: compare_exact,
+    TOKENS: compare_tokens,
+    LINES: compare_lines,
+    NUMERIC: compare_numeric
+}
+
+def open_output(path: str):
+    # вывод пишет тестируемая программа: только обычный файл в своем каталоге,
+    # символические ссылки не раскрываются (иначе сервис прочитал бы свои файлы или /dev/zero)
+    directory = os.path.dirname(path)
+    if os.path.realpath(path) != path_join(os.path.realpath(directory), os.path.basename(path)):
+        return None, "output is not a regular file"
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK)
+    except FileNotFoundError:
+        return None, "output not found"
+    except OSError:
+        return None, "output is not a regular file"
+    st = os.fstat(fd)
+    if not stat.S_ISREG(st.st_mode) or st.st_nlink != 1:
+        os.close(fd)
+        return None, "output is not a regular file"
+    return os.fdopen(fd, "rb"), None
+
+def check(options: dict, output_path: str, answer_path: str) -> str:
+    # возвращает None, если вывод совпал с ожидаемым, иначе описание первого отличия
+    output, message = open_output(output_path)
+    if output is None:
+        return message
+    with output, open(answer_path, "rb") as answer:
+        return COMPARATORS[options[COMPARE]](output, answer, options)
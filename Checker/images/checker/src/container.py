@@ -1,69 +1,112 @@
 from globals import *
-import docker
+import threading
+import time
+import metrics
+import sandbox
+import taskdir
 
 logger = log("container")
 
-def run(task: WrapperInterface, options: dict) -> str:
-    mounts = options.get(MOUNTS, [])
-    mem_limit = options.get(MEM_LIMIT)
-    memswap_limit = options.get(MEMSWAP_LIMIT)
-    readonly = options.get(READONLY, False)
+def get_status(oom_killed: bool, exit_code: int, output_limit: bool = False) -> str:
+    if oom_killed:
+        return OUT_OF_MEMORY
+    elif exit_code == 0:
+        return SUCCESS
+    elif exit_code == 124:
+        return TIMEOUT_STATUS
+    elif exit_code == EXIT_WRONG_ANSWER:
+        return WRONG_ANSWER
+    elif exit_code == EXIT_CHECKER_TIMEOUT:
+        return CHECKER_TIMEOUT
+    elif exit_code == EXIT_OUTPUT_LIMIT and output_limit:
+        # тот же код, который вернула сама программа, - обычная ошибка
+        return OUTPUT_LIMIT_STATUS
+    else:
+        return ERROR
+
+def observe(stage: str, backend: str, start: float) -> float:
+    # записывает длительность этапа и возвращает время его окончания
+    now = time.monotonic()
+    metrics.container_time.observe(now - start, stage, backend)
+    return now
+
+def drain(task: WrapperInterface, out) -> tuple:
+    # передает вывод в task, возвращает (время, потраченное на разбор, была ли строка превышения вывода)
+    spent = 0.0
+    output_limit = False
+    for line in out:
+        start = time.monotonic()
+        line = line.decode("utf-8", errors="replace")
+        logger.debug(line.rstrip().replace("debug: ", ""))
+        if line.rstrip() == OUTPUT_LIMIT_MARKER:
+            output_limit = True
+        task.parse_line(line)
+        spent += time.monotonic() - start
+    return spent, output_limit
+
+def watch_cancel(options: dict, kill) -> threading.Event:
+    # останавливает контейнер, если фаза отменена из другого потока
+    cancel = options.get(CANCEL)
+    finished = threading.Event()
+    if cancel is None:
+        return finished
 
-    client = docker.from_env()
-    kwargs = {
-        #"auto_remove": True,
-        MOUNTS: mounts,
-        MEM_LIMIT: mem_limit,
-        MEMSWAP_LIMIT: memswap_limit,
-        "pids_limit": -1,
-        "tty": False,
-        "stdin_open": False,
-        READONLY: readonly,
-        "entrypoint": ["/bin/bash"],
-        "network_disabled": True,
-        "working_dir": "/usr/src"
-    }
-    container = None
+    def watch():
+        cancel.wait()
+        if not finished.is_set():
+            try:
+                kill()
+            except Exception as e:
+                logger.warning("cancel: " + str(e))
+
+    threading.Thread(target=watch, daemon=True).start()
+    return finished
+
+def run(task: WrapperInterface, options: dict) -> str:
+    backend = sandbox.create(options)
+    finished = None
+    watcher = None
     try:
-        container = client.containers.create(options["image_name"], command=options["command"], **kwargs)
-        logger.info("image: " + options["image_name"] + ", container: " + container.name)
-        container.start()
+        start = time.monotonic()
+        backend.prepare()
+        end = observe("create", backend.name, start)
+        task.add_time(TIME_CREATE, end - start)
 
-        out = container.logs(
-            stdout=True, stderr=True, stream=True, follow=True
-        )
+        start = end
+        backend.materialize()
+        end = time.monotonic()
+        task.add_time(TIME_PREP, end - start)
 
-        lines = []
-        for line in out:
-            logger.debug(line.decode("utf-8").rstrip().replace("debug: ", ""))
-            lines.append(line.decode("utf-8"))
-            task.parse_output(lines)
+        start = end
+        backend.start()
+        observe("start", backend.name, start)
+        finished = watch_cancel(options, backend.kill)
+        watcher = taskdir.Watcher([backend.workspace_path() or options.get(STARTER_TEMP)], backend.kill)
 
-        container.reload() # обновляет container.attrs
-        container_state = container.attrs["State"]
-        
-        if container_state["OOMKilled"] == True:
-            status = "out_of_memory"
-        else:
-            exitCode = container_state["ExitCode"]
+        parsing, output_limit = drain(task, backend.output())
+        exit_code = backend.wait()
+        end = time.monotonic()
+        task.add_time(TIME_RUN, end - start - parsing)
 
-            if exitCode == 0:
-                status = SUCCESS
-            elif exitCode == 124:
-                status = "timeout"
-            else:
-                status = "error"
+        start = end
+        backend.collect()
+        end = time.monotonic()
+        task.add_time(TIME_TEARDOWN, end - start)
 
-        task.parse_output(lines, status)
+        status = get_status(backend.stats()["oom_killed"], exit_code, output_limit)
+        message = watcher.stop(options.get(STARTER_TEMP))
+        if message:
+            task.parse_line(message)
+            status = WORKSPACE_LIMIT_STATUS
+        start = time.monotonic()
+        task.parse_output(status)
+        task.add_time(TIME_DRAIN, parsing + time.monotonic() - start)
         return task.status
     finally:
-        if not container is None:
-            container.reload()
-            container_state = container.attrs["State"]
-            if container_state["Status"] == "running":
-                container.kill()
-            if container_state["Status"] == "created":
-                container.stop()
-            container.remove()
-    pass
-
+        if not finished is None:
+            finished.set()
+        if not watcher is None:
+            watcher.finished.set()
+        start = time.monotonic()
+        backend.destroy()
+        task.add_time(TIME_TEARDOWN, observe("teardown", backend.name, start) - start)
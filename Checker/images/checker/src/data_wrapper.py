@@ -1,9 +1,17 @@
 from globals import *
 from datetime import datetime
 import threading
+import time
 
 import container
 import checker
+import compare
+import failstats
+import taskdir
+import build_cache
+import metrics
+import parsers
+import shards
 import dotnet
 import python
 import gcc
@@ -12,18 +20,43 @@ import freepascal
 
 logger = log("task")
 
+# Как часто промежуточный результат разбора публикуется в get(), секунды
+PUBLISH_INTERVAL = float(os.environ.get("PUBLISH_INTERVAL", "0.5"))
+
 class Wrapper(WrapperInterface):
-    def __init__(self, options):
+    def __init__(self, options, shared = None):
+        self.shared = shared
         self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.version = 0
+        self.statuses = []
+        self.done = False
         self.options = options
         self.created = datetime.now()
         self.status_prefix = ""
         self.status = STARTING
+        self.priority = DEFAULT_PRIORITY
+        self.queued = 0
+        self.queue_wait = None
+        self.slots = 1
+        self.shard_runner = None
+        self.checker_built = False
         self.result = {
             STATUS: self.status
         }
         self.statistics = {}
-        self.__parse_output = self.parse_run
+        self.build_cache = {
+            build_cache.HITS: 0,
+            build_cache.MISSES: 0
+        }
+        self.parser = parsers.RunParser()
+        self.published = 0
+        self.phase = None
+        self.phase_started = None
+        self.phase_language = None
+        self.timing = {}
+        self.problem_key = None
+        self.order = None
     
     def select_module(self, options: dict):
         lang = options[LANGUAGE]
@@ -40,74 +73,228 @@ class Wrapper(WrapperInterface):
         else:
             raise Exception('Unknown language "' + lang + '"')
 
+    def build(self, module, options: dict, name: str) -> bool:
+        try:
+            if not self.timed(TIME_PREP, module.prepare_build, options, name):
+                return True
+        except BuildError as e:
+            # например, синтаксическая ошибка Python: результат - как у неудачной сборки в контейнере
+            self.parser = parsers.BuildParser()
+            for line in e.message.splitlines():
+                self.parse_line(line)
+            self.parse_output(ERROR)
+            logger.debug(ERROR)
+            return False
+        checker.protect_samples(options)
+
+        if self.timed(TIME_PREP, build_cache.restore, options):
+            self.build_cache[build_cache.HITS] += 1
+            logger.debug("build cache hit")
+            return True
+        self.build_cache[build_cache.MISSES] += 1
+
+        self.parser = parsers.BuildParser()
+        result = container.run(self, options)
+        logger.debug(result)
+        if result != SUCCESS:
+            return False
+
+        self.timed(TIME_PREP, build_cache.store, options)
+        return True
+
+    def build_checker(self, module, options: dict) -> bool:
+        if self.shared:
+            return self.shared.build_checker(self, module, options)
+        return self.build(module, options, CHECKER)
+
+    def run_shards(self, options: dict) -> str:
+        self.shard_runner = self.timed(TIME_PREP, shards.ShardRunner, self, options, checker.split_samples(self.options[SAMPLES], self.slots, self.order))
+        status = self.shard_runner.run()
+        self.statistics = self.shard_runner.result()
+        self.set(self.statistics, status)
+        return self.status
+
+    def publish_shards(self):
+        now = time.monotonic()
+        if now - self.published >= PUBLISH_INTERVAL:
+            self.published = now
+            self.set(self.shard_runner.result())
+
+    def run_fused(self, testee_module) -> bool:
+        # возвращает False, если совмещенный режим невозможен и нужно продолжить раздельный
+        testee_options = self.options[TESTEE]
+        checker_options = self.options[CHECKER]
+        checker_module = self.select_module(checker_options)
+
+        # build checker
+        self.set_phase(CHECKER + "_" + BUILD + "_", checker_options[LANGUAGE])
+        logger.debug("")
+        logger.debug(self.status_prefix + self.status)
+        if not self.build_checker(checker_module, checker_options):
+            return True
+        self.checker_built = True
+
+        self.timed(TIME_PREP, testee_module.prepare_run, testee_options)
+        self.timed(TIME_PREP, checker_module.prepare_run, checker_options)
+        if testee_options["image_name"] != checker_options["image_name"]:
+            logger.info("fused pipeline needs one image for testee and checker: " + testee_options["image_name"] + ", " + checker_options["image_name"])
+            return False
+
+        # run testee and checker samples
+        self.set_phase(TESTEE + "_", testee_options[LANGUAGE])
+        logger.debug("")
+        logger.debug(self.status_prefix + self.status)
+        self.timed(TIME_PREP, checker.prepare_samples, testee_options, self.options[SAMPLES])
+        self.timed(TIME_PREP, checker.prepare_fused, testee_options, checker_options, self.order)
+        self.parser = parsers.RunParser()
+        result = container.run(self, testee_options)
+        logger.debug(result)
+
+        if result in [SUCCESS, WRONG_ANSWER, CHECKER_TIMEOUT]:
+            self.lock.acquire()
+            try:
+                self.status_prefix = CHECKER + "_"
+                if result != SUCCESS:
+                    self.result["failed_sample"] = self.result["last_sample"]
+                self.changed()
+            finally:
+                self.lock.release()
+        return True
+
+    def run_compare(self, options: dict):
+        # встроенная проверка в сервисе: результат в тех же полях, что у CheckParser
+        self.set_phase(CHECKER + "_", options[COMPARE])
+        logger.debug("")
+        logger.debug(self.status_prefix + self.status)
+        self.parser = parsers.CheckParser(self.statistics)
+        status = SUCCESS
+        for i in self.order:
+            self.parse_line("sample: " + str(i))
+            message = self.timed(TIME_RUN, compare.check, options, checker.output_path(options, i), checker.answer_path(options, i))
+            if not message is None:
+                self.parse_line("wrong answer")
+                self.parse_line(message)
+                status = WRONG_ANSWER
+                break
+        self.parse_output(status)
+        logger.debug(status)
+        if status != SUCCESS:
+            self.lock.acquire()
+            try:
+                self.result["failed_sample"] = self.result["last_sample"]
+                self.changed()
+            finally:
+                self.lock.release()
+
+    def record_failure(self):
+        # первый непройденный пример: ошибка, тайм-аут или нехватка памяти у программы,
+        # неверный ответ по проверке; сбои самой проверки не считаются
+        if self.status_prefix == TESTEE + "_":
+            counted = self.status in [ERROR, TIMEOUT_STATUS, OUT_OF_MEMORY]
+        elif self.status_prefix == CHECKER + "_":
+            counted = self.status == WRONG_ANSWER
+        else:
+            counted = False
+        if not counted:
+            return
+        failstats.record(self.problem_key, self.result.get("failed_sample") or self.result.get("last_sample", 0))
+
+    def stats_key(self) -> str:
+        # у зарегистрированной задачи - ее uid, у пакета - один на всех участников
+        if self.shared is None:
+            return failstats.problem_key(self.options)
+        # без self.shared.lock: гонка лишь повторит вычисление
+        if self.shared.stats_key is None:
+            self.shared.stats_key = failstats.problem_key(self.options)
+        return self.shared.stats_key
+
     def run_temp(self):
         # testee
         testee_options = self.options[TESTEE]
+        # примеры, на которых решения этой задачи чаще не проходят, - первыми
+        self.problem_key = self.stats_key()
+        self.order = failstats.order(self.problem_key, len(self.options[SAMPLES]))
         module = self.select_module(testee_options)
         logger.debug("-------------------------------------------------")
 
         # build testee
-        self.status_prefix = TESTEE + "_" + BUILD + "_"
-        self.status = RUNNING
+        self.set_phase(TESTEE + "_" + BUILD + "_", testee_options[LANGUAGE])
         logger.debug(self.status_prefix + self.status)
-        if module.prepare_build(testee_options, TESTEE):
-            self.__parse_output = self.parse_build
-            result = container.run(self, testee_options)
-            logger.debug(result)
-            if result != SUCCESS:
+        if not self.build(module, testee_options, TESTEE):
+            return
+
+        compare_checker = COMPARE in self.options[CHECKER]
+        if self.options.get(PIPELINE) == FUSED and not compare_checker:
+            if self.run_fused(module):
                 return
 
         # run testee samples
-        self.status_prefix = TESTEE + "_"
-        self.status = RUNNING
+        self.set_phase(TESTEE + "_", testee_options[LANGUAGE])
         logger.debug("")
         logger.debug(self.status_prefix + self.status)
-        module.prepare_run(testee_options)
-        checker.prepare_testee(testee_options, self.options[SAMPLES])
-        self.__parse_output = self.parse_run
-        result = container.run(self, testee_options)
+        self.timed(TIME_PREP, module.prepare_run, testee_options)
+        self.timed(TIME_PREP, checker.prepare_samples, testee_options, self.options[SAMPLES])
+        if self.slots > 1:
+            result = self.run_shards(testee_options)
+        else:
+            self.timed(TIME_PREP, checker.prepare_testee, testee_options, self.order)
+            self.parser = parsers.RunParser()
+            result = container.run(self, testee_options)
         logger.debug(result)
         if result != SUCCESS:
             return
 
         # checker
         checker_options = self.options[CHECKER]
+        if compare_checker:
+            self.run_compare(checker_options)
+            return
         module = self.select_module(checker_options)
 
         # build checker
-        self.status_prefix = CHECKER + "_" + BUILD + "_"
-        self.status = RUNNING
+        self.set_phase(CHECKER + "_" + BUILD + "_", checker_options[LANGUAGE])
         logger.debug("")
         logger.debug(self.status_prefix + self.status)
-        if module.prepare_build(checker_options, CHECKER):
-            self.__parse_output = self.parse_build
-            result = container.run(self, checker_options)
-            logger.debug(result)
-            if result != SUCCESS:
-                return
+        if not self.checker_built and not self.build_checker(module, checker_options):
+            return
 
         # run checker samples
-        self.status_prefix = CHECKER + "_"
-        self.status = RUNNING
+        self.set_phase(CHECKER + "_", checker_options[LANGUAGE])
         logger.debug("")
         logger.debug(self.status_prefix + self.status)
-        module.prepare_run(checker_options)
-        checker.prepare_checker(checker_options, self.options[SAMPLES])
-        self.__parse_output = self.parse_check
+        self.timed(TIME_PREP, module.prepare_run, checker_options)
+        self.timed(TIME_PREP, checker.prepare_checker, checker_options, self.order)
+        self.parser = parsers.CheckParser(self.statistics)
         result = container.run(self, checker_options)
         logger.debug(result)
         if result != SUCCESS:
             return
 
     def run(self):
-        with TemporaryDirectory(self.options):
-            self.options[TESTEE][DOCKER_TEMP] = self.options[DOCKER_TEMP]
-            self.options[TESTEE][STARTER_TEMP] = self.options[STARTER_TEMP]
-            self.options[CHECKER][DOCKER_TEMP] = self.options[DOCKER_TEMP]
-            self.options[CHECKER][STARTER_TEMP] = self.options[STARTER_TEMP]
-            self.run_temp()
+        try:
+            with taskdir.TemporaryDirectory(self.options):
+                for name in [TESTEE, CHECKER]:
+                    if name in self.options:
+                        self.options[name][DOCKER_TEMP] = self.options[DOCKER_TEMP]
+                        self.options[name][STARTER_TEMP] = self.options[STARTER_TEMP]
+                        if self.shared:
+                            self.options[name][SAMPLES_DIR] = self.shared.samples_dir
+                            self.options[name][STARTER_SAMPLES_DIR] = path_join(self.shared.starter_path, "samples")
+                self.run_temp()
+            self.record_failure()
+        finally:
+            if self.shared:
+                self.shared.release()
         logger.debug(self.get())
 
+    def changed(self):
+        # вызывается под self.lock после любого изменения результата
+        self.version += 1
+        status = self.status_prefix + self.status
+        if len(self.statuses) == 0 or self.statuses[-1] != status:
+            self.statuses.append(status)
+        self.condition.notify_all()
+
     def set(self, result: dict, status: str = None):
         self.lock.acquire()
         try:
@@ -115,6 +302,7 @@ class Wrapper(WrapperInterface):
             self.result = result
             if status:
                 self.status = status
+            self.changed()
         finally:
             self.lock.release()
 
@@ -123,97 +311,130 @@ class Wrapper(WrapperInterface):
         try:
             self.created = datetime.now()
             self.status = status
+            self.changed()
+        finally:
+            self.lock.release()
+
+    def end_phase(self):
+        # вызывается под self.lock
+        if self.phase_started is None:
+            return
+        duration = time.monotonic() - self.phase_started
+        metrics.phase_time.observe(duration, self.phase, self.phase_language)
+        self.timing[self.phase]["duration"] = round(duration, 6)
+        self.phase_started = None
+
+    def set_phase(self, prefix: str, language: str):
+        self.lock.acquire()
+        try:
+            self.end_phase()
+            self.phase = prefix.rstrip("_")
+            self.phase_started = time.monotonic()
+            self.phase_language = language
+            self.timing[self.phase] = {
+                "started": datetime.now().isoformat(),
+                "duration": None,
+                TIME_PREP: 0.0,
+                TIME_CREATE: 0.0,
+                TIME_RUN: 0.0,
+                TIME_DRAIN: 0.0,
+                TIME_TEARDOWN: 0.0
+            }
+            self.created = datetime.now()
+            self.status_prefix = prefix
+            self.status = RUNNING
+            self.changed()
+        finally:
+            self.lock.release()
+
+    def finish(self):
+        self.lock.acquire()
+        try:
+            self.end_phase()
+            metrics.results.inc(self.status_prefix.rstrip("_") or "none", self.status)
+            self.done = True
+            self.changed()
         finally:
             self.lock.release()
 
+    def add_time(self, stage: str, seconds: float):
+        self.lock.acquire()
+        try:
+            if self.phase in self.timing:
+                timing = self.timing[self.phase]
+                timing[stage] = round(timing[stage] + seconds, 6)
+        finally:
+            self.lock.release()
+
+    def timed(self, stage: str, fn, *args):
+        # вызывает fn(*args) и добавляет время вызова к stage текущей фазы
+        start = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            self.add_time(stage, time.monotonic() - start)
+
     def get(self) -> WrapperInterface:
         self.lock.acquire()
         try:
             self.result[STATUS] = self.status_prefix + self.status
+            self.result[TIMING] = {phase: dict(timing) for phase, timing in self.timing.items()}
+            self.result["build_cache"] = self.build_cache
+            self.result["queue_wait"] = self.queue_wait
+            self.result["done"] = self.done
             return self.result
         finally:
             self.lock.release()
 
-    def parse_run(self, lines: list) -> dict:
-        result = dict(        
-            run_samples = 0,
-            last_sample = 0,
-            output = "",
-            time_max = 0,
-            time_min = 0,
-            time_avg = 0,
-            mem_max = 0,
-            mem_min = 0,
-            mem_avg = 0,
-        )
-        errors = []
-        for line in lines:
-            if line.startswith("sample: "):
-                result["run_samples"] += 1
-                result["last_sample"] = int(line[8:])
-                errors = []
-            else:
-                if line.startswith("mem: "):
-                    for p in line.split(";"):
-                        if p.startswith("mem: "):
-                            mem = int(p[5:])
-                            result["mem_max"] = max(result["mem_max"], mem)
-                            if result["mem_min"] == 0:
-                                result["mem_min"] = mem
-                            else:
-                                result["mem_min"] = min(result["mem_min"], mem)
-                            result["mem_avg"] += mem
-                        elif p.startswith("time: "):
-                            t = float(p[6:])
-                            result["time_max"] = max(result["time_max"], t)
-                            if result["time_min"] == 0:
-                                result["time_min"] = t
-                            else:
-                                result["time_min"] = min(result["time_min"], t)
-                            result["time_avg"] += t
-                    pass
-                else:
-                    if line.startswith("debug: "):
-                        pass
-                    else:
-                        errors.append(line)
-                pass # if
-            pass # if
-        pass # for
-
-        result["output"] = "\n".join(lines).replace("debug: ", "")
-        result["errors"] = "\n".join(errors)
-        if result["run_samples"] > 0:
-            result["mem_avg"] = result["mem_avg"] / result["run_samples"]
-            result["time_avg"] = result["time_avg"] / result["run_samples"]
-
-        self.statistics = result
-        return result
-
-    def parse_check(self, lines: list) -> dict:
-        result = self.statistics
-        errors = []
-        for line in lines:
-            if line.startswith("sample: "):
-                result["last_sample"] = int(line[8:])
-                errors = []
-            else:
-                if line.startswith("debug: "):
-                    pass
-                else:
-                    errors.append(line)
-            pass # if
-        pass # for
-
-        result["output"] = "\n".join(lines).replace("debug: ", "")
-        result["errors"] = "\n".join(errors)
-
-        return result
-
-    def parse_build(self, lines: list) -> dict:
-        return {
-            "output": "\n".join(lines)
-        }
+    def etag(self) -> str:
+        # версия результата для условных запросов; читается до get(),
+        # поэтому никогда не бывает новее отданного результата
+        self.lock.acquire()
+        try:
+            return "done" if self.done else "v" + str(self.version)
+        finally:
+            self.lock.release()
 
-    def parse_output(self, lines: list, status: str = None):
-        self.set(self.__parse_output(lines), status)
+    def wait_status(self, status: str, timeout: float):
+        # ждет смены статуса или завершения задачи
+        self.lock.acquire()
+        try:
+            self.condition.wait_for(lambda: self.done or self.status_prefix + self.status != status, timeout)
+        finally:
+            self.lock.release()
+
+    def wait_changes(self, version: int, timeout: float) -> tuple:
+        # для потока событий: (версия, история статусов, прогресс, задача завершена)
+        self.lock.acquire()
+        try:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            progress = {
+                "run_samples": self.result.get("run_samples", 0),
+                "last_sample": self.result.get("last_sample", 0)
+            }
+            return self.version, list(self.statuses), progress, self.done
+        finally:
+            self.lock.release()
+
+    def parse_line(self, line: str):
+        self.parser.feed(line)
+        now = time.monotonic()
+        if now - self.published >= PUBLISH_INTERVAL:
+            self.published = now
+            self.set(self.parser.result())
+
+    def parse_output(self, status: str = None):
+        result = self.parser.result()
+        if isinstance(self.parser, parsers.RunParser):
+            self.statistics = result
+        self.set(result, status)
+
+
+class CheckerBuild(Wrapper):
+    # сборка проверки зарегистрированной задачи сразу после регистрации
+    def run_temp(self):
+        checker_options = self.options[CHECKER]
+        module = self.select_module(checker_options)
+        self.set_phase(CHECKER + "_" + BUILD + "_", checker_options[LANGUAGE])
+        if self.build_checker(module, checker_options):
+            self.setStatus(SUCCESS)
@@ -0,0 +1,151 @@
+from globals import *
+import docker
+import queue
+import threading
+import time
+
+logger = log("dockerapi")
+
+# Один клиент Docker на весь сервис: пул HTTP-соединений вместо нового клиента на каждую фазу.
+# Завершение контейнеров фаз (код и OOM) приходит из одной подписки на события демона,
+# удаление контейнеров выполняется фоновым потоком пачками.
+DOCKER_POOL_SIZE = int(os.environ.get("DOCKER_POOL_SIZE", str(MAX_CONTAINERS * 2 + 4)))
+# Сколько ждать события die после окончания вывода, потом - запрос состояния контейнера, секунды
+DOCKER_EVENT_TIMEOUT = float(os.environ.get("DOCKER_EVENT_TIMEOUT", "5"))
+# Наибольший размер пачки удаляемых контейнеров
+DOCKER_REMOVE_BATCH = int(os.environ.get("DOCKER_REMOVE_BATCH", "16"))
+
+# Метка контейнеров фаз, по ней фильтруются события
+LABEL = "checker.phase"
+# Сколько секунд хранить события контейнеров, которых никто не ждет
+EVENT_TTL = 60
+
+class Events:
+    def __init__(self, client) -> None:
+        self.client = client
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.exits = {} # id -> (код завершения, время)
+        self.oom = {} # id -> время
+        self.since = None
+        self.stream = self.subscribe()
+        threading.Thread(target=self.wait, daemon=True).start()
+
+    def subscribe(self):
+        # события после self.since повторяются, поэтому переподключение ничего не теряет;
+        # запрос отправляется сразу, подписка действует до запуска первого контейнера
+        filters = {
+            "type": "container",
+            "event": ["die", "oom"],
+            "label": [LABEL]
+        }
+        return self.client.events(decode=True, filters=filters, since=self.since)
+
+    def feed(self, event: dict):
+        id = event.get("id") or event.get("Actor", {}).get("ID")
+        action = event.get("Action") or event.get("status")
+        now = time.monotonic()
+        self.lock.acquire()
+        try:
+            if action == "oom":
+                self.oom[id] = now
+            elif action == "die":
+                code = int(event.get("Actor", {}).get("Attributes", {}).get("exitCode", "-1"))
+                self.exits[id] = (code, now)
+                self.condition.notify_all()
+            if "time" in event:
+                self.since = event["time"]
+            self.prune(now)
+        finally:
+            self.lock.release()
+
+    def prune(self, now: float):
+        # вызывается под self.lock
+        for id in [id for id, (_, t) in self.exits.items() if now - t > EVENT_TTL]:
+            del self.exits[id]
+        for id in [id for id, t in self.oom.items() if now - t > EVENT_TTL]:
+            del self.oom[id]
+
+    def wait(self):
+        while True:
+            try:
+                for event in self.stream:
+                    self.feed(event)
+                logger.warning("event stream closed")
+            except Exception as e:
+                logger.warning("event stream: " + str(e))
+            time.sleep(1)
+            try:
+                self.stream = self.subscribe()
+            except Exception as e:
+                logger.warning("event stream: " + str(e))
+
+    def wait_exit(self, id: str, timeout: float) -> tuple:
+        # (код завершения, OOM) или None, если события нет
+        self.lock.acquire()
+        try:
+            self.condition.wait_for(lambda: id in self.exits, timeout)
+            if not id in self.exits:
+                return None
+            code, _ = self.exits.pop(id)
+            return code, self.oom.pop(id, None) is not None
+        finally:
+            self.lock.release()
+
+
+class Remover:
+    def __init__(self, client) -> None:
+        self.client = client
+        self.queue = queue.Queue()
+        threading.Thread(target=self.wait, daemon=True).start()
+
+    def wait(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < DOCKER_REMOVE_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for id in batch:
+                try:
+                    # force: контейнер, который еще выполняется, останавливается
+                    self.client.api.remove_container(id, force=True)
+                except docker.errors.NotFound:
+                    pass
+                except Exception as e:
+                    logger.warning("remove " + id + ": " + str(e))
+
+
+lock = threading.Lock()
+shared = None
+events = None
+remover = None
+
+def client():
+    global shared, events, remover
+    lock.acquire()
+    try:
+        if shared is None:
+            c = docker.from_env(max_pool_size=DOCKER_POOL_SIZE)
+            events = Events(c)
+            remover = Remover(c)
+            shared = c
+        return shared
+    finally:
+        lock.release()
+
+def wait_exit(container) -> tuple:
+    # (код завершения, OOM) из события die; если событие не пришло - из состояния контейнера
+    client()
+    result = events.wait_exit(container.id, DOCKER_EVENT_TIMEOUT)
+    if result is None:
+        logger.info("no die event for " + container.name + ", inspecting")
+        container.reload()
+        state = container.attrs["State"]
+        result = (state["ExitCode"], state["OOMKilled"] == True)
+    return result
+
+def remove(id: str):
+    client()
+    remover.queue.put(id)
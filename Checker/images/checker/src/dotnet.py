@@ -1,15 +1,22 @@
 from globals import *
 from docker.types import Mount
 
+# Проекты console, восстановленные при сборке образа dotnet:builder (cs, fs, vb, проект main):
+# сборка копирует шаблон и не выполняет dotnet new и restore
+DOTNET_TEMPLATES = os.environ.get("DOTNET_TEMPLATES", "/opt/templates")
+
 def prepare_build(options: dict, name: str) -> bool:
     language = options[LANGUAGE]
     
     if language == "C#":
         file_ext = ".cs"
+        template = "cs"
     elif language == "F#":
         file_ext = ".fs"
+        template = "fs"
     elif language == "VB":
         file_ext = ".vb"
+        template = "vb"
     else:
         raise Exception('Unknown dotnet language: "' + language + '"')
 
@@ -18,6 +25,7 @@ def prepare_build(options: dict, name: str) -> bool:
     options[MOUNTS] = mounts = []
 
     cmd = ["#!/bin/bash"]
+    options["commands"] = cmd
 
     docker_tmp = options[DOCKER_TEMP]
     starter_tmp = options[STARTER_TEMP]
@@ -27,17 +35,20 @@ def prepare_build(options: dict, name: str) -> bool:
     with open(path_join(starter_tmp, filename), "x", newline="\n") as f:
         f.write(options[SOURCE])
 
-    cmd_debug(cmd, "dotnet new console -o " + name)
+    cmd_debug(cmd, "cp -r " + DOTNET_TEMPLATES + "/" + template + " " + name)
     cmd_debug(cmd, "cp " + filename + " " + name + "/Program" + file_ext)
-    cmd_debug(cmd, "dotnet build --configuration Release --no-restore -v q " + name)
+    # вывод - через файл: серверы компилятора, оставшиеся в песочнице пула, не держат поток вывода
+    log_filename = "build_" + name + ".log"
+    cmd_debug(cmd, "dotnet build --configuration Release --no-restore -v q " + name + " > " + log_filename + " 2>&1")
     cmd.append("retVal=$?")
+    cmd.append("cat " + log_filename)
     cmd.append("if [ $retVal -ne 0 ]; then")
     cmd.append("  exit $retVal")
     cmd.append("fi")
     cmd.append('echo "debug: build success"')
 
     options["bin_path"] = name + "/bin/Release/net6.0"
-    options[CMD] = "dotnet bin/" + name + ".dll"
+    options[CMD] = "dotnet bin/main.dll"
 
     s = "\n".join(cmd)
     command_filename = "build_" + name + ".sh"
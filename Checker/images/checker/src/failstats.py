@@ -0,0 +1,112 @@
+from globals import *
+import atexit
+import json
+import threading
+import time
+
+import problems
+
+logger = log("failstats")
+
+# Счетчики первого непройденного примера по задачам: примеры, на которых решения
+# чаще всего не проходят, запускаются первыми. Номера примеров в результате не меняются.
+# Задача - зарегистрированная (problem) или та же проверка с теми же примерами.
+FAIL_STATS = os.environ.get("FAIL_STATS", "1") != "0"
+FAIL_STATS_PATH = os.environ.get("FAIL_STATS_PATH") or path_join(starter_temp(), "fail_stats.json")
+# Как часто счетчики сохраняются на диск, секунды
+FAIL_STATS_INTERVAL = float(os.environ.get("FAIL_STATS_INTERVAL", "60"))
+# При такой сумме счетчики задачи делятся пополам, чтобы порядок следовал за новыми решениями
+FAIL_STATS_DECAY = int(os.environ.get("FAIL_STATS_DECAY", "1000"))
+# Сколько задач помнить; дольше всех не обновлявшиеся забываются
+FAIL_STATS_MAX = int(os.environ.get("FAIL_STATS_MAX", "10000"))
+
+class FailStats:
+    def __init__(self, path: str) -> None:
+        self.lock = threading.Lock()
+        self.path = path
+        self.counters = {} # задача -> {номер примера: счетчик}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            for key, counters in data.items():
+                self.counters[key] = {int(i): n for i, n in counters.items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.exception(e)
+
+    def save(self):
+        self.lock.acquire()
+        try:
+            if not self.dirty:
+                return
+            data = json.dumps(self.counters)
+            self.dirty = False
+        finally:
+            self.lock.release()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+    def record(self, key: str, sample: int):
+        self.lock.acquire()
+        try:
+            # последняя обновленная задача - в конце словаря
+            counters = self.counters.pop(key, {})
+            self.counters[key] = counters
+            counters[sample] = counters.get(sample, 0) + 1
+            if sum(counters.values()) > FAIL_STATS_DECAY:
+                for i in list(counters):
+                    counters[i] //= 2
+                    if counters[i] == 0:
+                        del counters[i]
+            while len(self.counters) > FAIL_STATS_MAX:
+                del self.counters[next(iter(self.counters))]
+            self.dirty = True
+        finally:
+            self.lock.release()
+
+    def order(self, key: str, count: int) -> list:
+        # номера примеров 1..count: сначала чаще не пройденные, при равенстве - по порядку
+        self.lock.acquire()
+        try:
+            counters = dict(self.counters.get(key, {}))
+        finally:
+            self.lock.release()
+        return sorted(range(1, count + 1), key=lambda i: -counters.get(i, 0))
+
+
+def problem_key(options: dict) -> str:
+    if PROBLEM in options:
+        return options[PROBLEM]
+    return problems.registry.problem_id(options)
+
+def order(key: str, count: int) -> list:
+    if not FAIL_STATS:
+        return list(range(1, count + 1))
+    return stats.order(key, count)
+
+def record(key: str, sample: int):
+    if FAIL_STATS and sample > 0:
+        stats.record(key, sample)
+
+def save():
+    try:
+        stats.save()
+    except Exception as e:
+        logger.exception(e)
+
+def wait():
+    while True:
+        time.sleep(FAIL_STATS_INTERVAL)
+        save()
+
+stats = FailStats(FAIL_STATS_PATH)
+atexit.register(save)
+t = threading.Thread(target=wait, daemon=True)
+t.start()
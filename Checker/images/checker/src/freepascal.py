@@ -14,6 +14,7 @@ def prepare_build(options: dict, name: str) -> bool:
     options[MOUNTS] = mounts = []
 
     cmd = ["#!/bin/bash"]
+    options["commands"] = cmd
 
     docker_tmp = options[DOCKER_TEMP]
     starter_tmp = options[STARTER_TEMP]
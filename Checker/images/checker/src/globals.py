@@ -1,19 +1,37 @@
 import traceback
 import os
 import logging
-import tempfile
 
 LOG_LEVEL = logging.DEBUG
 
+MAX_CONTAINERS = int(os.environ.get("MAX_CONTAINERS", "4"))
+# Наибольший размер вывода тестируемой программы на одном примере, если не задан output_limit
+DEFAULT_OUTPUT_LIMIT = os.environ.get("OUTPUT_LIMIT", "64m")
+# Строка вывода контейнера длиннее этого числа байт передается на разбор частями
+LINE_READ_LIMIT = 65536
+# Пользователь тестируемой программы в совмещенном режиме (pipeline: fused)
+FUSED_USER = os.environ.get("FUSED_USER", "65534")
+
 UID = "uid"
 MOUNTS = "mounts"
 MEM_LIMIT = "mem_limit"
 MEMSWAP_LIMIT = "memswap_limit"
+OUTPUT_LIMIT = "output_limit"
 READONLY = "read_only"
 TIMEOUT = "timeout"
 LANGUAGE = "language"
 CMD = "cmd"
 
+PRIORITY = "priority"
+SHARDS = "shards"
+CANCEL = "cancel"
+PIPELINE = "pipeline"
+USER = "user"
+TIMEOUT_MODE = "timeout_mode"
+COMPARE = "compare"
+ABS_EPS = "abs_eps"
+REL_EPS = "rel_eps"
+
 STATUS = "status"
 RESULT = "result"
 SOURCE = "source"
@@ -22,6 +40,13 @@ CHECKER = "checker"
 SAMPLES = "samples"
 DOCKER_TEMP = "docker_temp"
 STARTER_TEMP = "starter_temp"
+SAMPLES_DIR = "samples_dir"
+STARTER_SAMPLES_DIR = "starter_samples_dir"
+INPUT = "input"
+OUTPUT = "output"
+TESTEES = "testees"
+PROBLEM = "problem"
+LIMITS = "limits"
 
 # Results:
 STARTING = "starting"
@@ -31,24 +56,58 @@ EXCEPTION = "exception"
 BUILD = "build"
 CHECKING = "checking"
 SUCCESS = "success"
-
-class TemporaryDirectory:
-    def __init__(self, data: dict) -> None:
-        self.data = data
-        data[DOCKER_TEMP] = os.environ["DOCKER_TEMP"] or "/tmp"
-        data[STARTER_TEMP] = os.environ["STARTER_TEMP"] or "/tmp"
-
-        self.tmp = tempfile.TemporaryDirectory(dir=data[STARTER_TEMP])
-
-    def __enter__(self):
-        path = self.tmp.__enter__()
-        temp_name = os.path.basename(path)
-        self.data[STARTER_TEMP] = path_join(self.data[STARTER_TEMP], temp_name)
-        self.data[DOCKER_TEMP] = path_join(self.data[DOCKER_TEMP], temp_name)
-        return None
-        
-    def __exit__(self, exc, value, tb):
-        self.tmp.__exit__(exc, value, tb)
+ERROR = "error"
+TIMEOUT_STATUS = "timeout"
+OUT_OF_MEMORY = "out_of_memory"
+WRONG_ANSWER = "wrong_answer"
+CHECKER_TIMEOUT = "checker_timeout"
+OUTPUT_LIMIT_STATUS = "output_limit"
+WORKSPACE_LIMIT_STATUS = "workspace_limit"
+
+# Составляющие времени фазы в result["timing"]
+TIMING = "timing"
+TIME_PREP = "prep"          # подготовка файлов на стороне сервиса
+TIME_CREATE = "create"      # создание контейнера или получение его из пула
+TIME_RUN = "run"            # от запуска до завершения, без разбора вывода
+TIME_DRAIN = "drain"        # разбор вывода
+TIME_TEARDOWN = "teardown"  # остановка и удаление контейнера
+
+# Режимы timeout_mode: ограничение астрономического или процессорного времени
+WALL = "wall"
+CPU = "cpu"
+
+# Встроенные проверки checker.compare
+EXACT = "exact"         # побайтовое совпадение
+TOKENS = "tokens"       # совпадение токенов, пробельные символы не важны
+LINES = "lines"         # совпадение строк без пробелов в конце
+NUMERIC = "numeric"     # числа с погрешностью abs_eps или rel_eps, остальное - как tokens
+COMPARE_MODES = [EXACT, TOKENS, LINES, NUMERIC]
+
+# Режимы pipeline
+SEPARATE = "separate"
+FUSED = "fused"
+
+# Коды завершения скрипта в совмещенном режиме, как в Checker/test/py/test_starter.py
+EXIT_WRONG_ANSWER = 200
+EXIT_CHECKER_TIMEOUT = 224
+# Тестируемая программа превысила output_limit: скрипт печатает OUTPUT_LIMIT_MARKER
+# и завершается с этим кодом; код без строки - обычная ошибка программы
+EXIT_OUTPUT_LIMIT = 153
+OUTPUT_LIMIT_MARKER = "output limit exceeded"
+
+# Классы приоритета задач: меньше - раньше
+PRIORITIES = {
+    "contest": 0,
+    "practice": 1,
+    "rejudge": 2
+}
+DEFAULT_PRIORITY = "practice"
+
+class BuildError(Exception):
+    # ошибка сборки, найденная в сервисе без контейнера сборки
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
 
 
 class WrapperInterface:
@@ -61,7 +120,13 @@ class WrapperInterface:
     def get(self):
         pass
 
-    def parse_output(self, lines: list, status: str):
+    def parse_line(self, line: str):
+        pass
+
+    def parse_output(self, status: str):
+        pass
+
+    def add_time(self, stage: str, seconds: float):
         pass
 
 
@@ -76,6 +141,19 @@ def exception_str(e: BaseException) -> str:
     tb = traceback.TracebackException.from_exception(e)
     return str(e) + "\n" + "".join(tb.stack.format())
 
+def docker_temp() -> str:
+    return os.environ.get("DOCKER_TEMP") or "/tmp"
+
+def starter_temp() -> str:
+    return os.environ.get("STARTER_TEMP") or "/tmp"
+
+def workspace_docker() -> str:
+    # каталоги задач и песочниц; можно вынести на tmpfs отдельно от STARTER_TEMP
+    return os.environ.get("WORKSPACE_DOCKER") or docker_temp()
+
+def workspace_starter() -> str:
+    return os.environ.get("WORKSPACE_STARTER") or starter_temp()
+
 def path_join(path: str, filename: str) -> str:
     return os.path.join(path, filename).replace("\\", "/")
 
@@ -83,3 +161,14 @@ def cmd_debug(cmd: list, command: str):
     cmd.append('echo "debug: ' + command.replace('"', '\\"') + '"')
     cmd.append(command)
 
+def parse_size(value) -> int:
+    # размер в формате docker: 100m, 1g, 512k или число байт
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().lower()
+    units = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
@@ -1,51 +1,217 @@
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+import gzip
 import json
+import math
+import os
+import signal
+import threading
 import starter
+import metrics
 import logging
 import check_json
+from urllib.parse import urlsplit, parse_qs
+from globals import STATUS
 
 logger = logging.getLogger("checker")
 logging.basicConfig()
 logger.setLevel(logging.INFO)
 
+HTTP_WORKERS = int(os.environ.get("HTTP_WORKERS", "16"))
+# Сколько запросов может одновременно ждать (?wait=N и /events/<uid>). Ждущие запросы
+# выполняются в дополнительных потоках сверх HTTP_WORKERS и не занимают потоки
+# остальных запросов; сверх этого числа - ответ 503
+HTTP_WAITERS = int(os.environ.get("HTTP_WAITERS", "64"))
+# Сколько секунд держать простаивающее keep-alive соединение
+HTTP_KEEPALIVE = float(os.environ.get("HTTP_KEEPALIVE", "5"))
+# Наибольшее время ожидания для GET /result/<uid>?wait=N, секунды
+LONG_POLL_MAX = float(os.environ.get("LONG_POLL_MAX", "60"))
+# Как часто отправлять комментарий в поток /events/<uid>, если ничего не изменилось
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", "15"))
+# Ответы меньше этого размера, байты, не сжимаются
+GZIP_MIN_SIZE = int(os.environ.get("GZIP_MIN_SIZE", "1024"))
+
+class ThreadPoolHTTPServer(HTTPServer):
+    def __init__(self, server_address, RequestHandlerClass, workers: int, waiters: int):
+        super().__init__(server_address, RequestHandlerClass)
+        self.executor = ThreadPoolExecutor(max_workers=workers + waiters, thread_name_prefix="http")
+        self.waiters = threading.Semaphore(waiters)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # ждет завершения уже принятых запросов
+        self.executor.shutdown(wait=True)
+
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = HTTP_KEEPALIVE
 
-    def send_text(self, code: int, message: str):
+    def send_text(self, code: int, message: str, content_type: str = "application/text"):
+        body = message.encode("utf-8")
         self.send_response(code)
-        self.send_header("Content-type", "application/text")
-        self.send_header("Content-Length", str(len(message)))
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(message.encode("utf-8"))
+        self.wfile.write(body)
+
+    def accepts_gzip(self) -> bool:
+        for coding in (self.headers.get("Accept-Encoding") or "").split(","):
+            name, _, params = coding.strip().partition(";")
+            if name.strip().lower() in ["gzip", "*"] and params.replace(" ", "") != "q=0":
+                return True
+        return False
 
-    def send_json(self, data):
-        text = json.dumps(data, indent=4, default=str)
+    def send_json(self, data, etag: str = None):
+        # компактный JSON; ?pretty=1 - с отступами, для чтения человеком
+        if "pretty" in parse_qs(urlsplit(self.path).query):
+            body = json.dumps(data, indent=4, default=str).encode("utf-8")
+        else:
+            body = json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+        gzipped = len(body) >= GZIP_MIN_SIZE and self.accepts_gzip()
+        if gzipped:
+            body = gzip.compress(body, compresslevel=5)
         self.send_response(200)
         self.send_header("Content-type", "application/json")
-        self.send_header("Content-Length", str(len(text)))
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Vary", "Accept-Encoding")
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_not_modified(self, etag: str):
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+    def send_result(self, task, query: dict):
+        # fields=status,done - только перечисленные поля результата, без больших output и errors
+        fields = [name for value in query.get("fields", []) for name in value.split(",") if name]
+        etag = "W/\"" + task.etag() + (":" + ",".join(fields) if fields else "") + "\""
+        if etag in [tag.strip() for tag in (self.headers.get("If-None-Match") or "").split(",")]:
+            self.send_not_modified(etag)
+            return
+        result = task.get()
+        if fields:
+            result = {name: result[name] for name in fields if name in result}
+        self.send_json(result, etag)
+
+    def wait_slot(self) -> bool:
+        # место для ждущего запроса; False - ответ 503 уже отправлен
+        if self.server.waiters.acquire(blocking=False):
+            return True
+        self.send_text(503, "too many waiting requests")
+        return False
+
+    def send_events(self, task):
+        if not self.wait_slot():
+            return
+        try:
+            self.stream_events(task)
+        finally:
+            self.server.waiters.release()
+
+    def stream_events(self, task):
+        self.send_response(200)
+        self.send_header("Content-type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
         self.end_headers()
-        self.wfile.write(text.encode("utf-8"))
+        self.close_connection = True
+
+        version = -1
+        sent_statuses = 0
+        progress = None
+        while True:
+            new_version, statuses, new_progress, done = task.wait_changes(version, SSE_HEARTBEAT)
+            events = []
+            if new_version == version:
+                events.append(": heartbeat\n\n")
+            version = new_version
+            for status in statuses[sent_statuses:]:
+                events.append("event: status\ndata: " + json.dumps({STATUS: status}) + "\n\n")
+            sent_statuses = len(statuses)
+            if new_progress != progress:
+                progress = new_progress
+                events.append("event: progress\ndata: " + json.dumps(progress) + "\n\n")
+            if done:
+                events.append("event: result\ndata: " + json.dumps(task.get(), default=str) + "\n\n")
+            try:
+                self.wfile.write("".join(events).encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if done:
+                return
 
     def do_GET(self):
         try:
-            list = self.path.split("/")
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            list = url.path.split("/")
             paths = list[1:]
+            if paths == ["scheduler"]:
+                self.send_json(starter.scheduler_stats())
+                return
+            if paths == ["metrics"]:
+                self.send_text(200, metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+                return
+            if len(paths) == 2 and paths[0] == "problem":
+                problem = starter.problem_get(paths[1])
+                if problem is None:
+                    self.send_text(400, paths[1] + " not found")
+                else:
+                    self.send_json(problem)
+                return
             if len(paths) > 0:
                 if len(paths) == 2:
-                    if paths[0] == "result":
+                    if paths[0] in ["result", "events"]:
                         uid = paths[1]
                         task = starter.task_get(uid)
                         if task == None:
                             self.send_text(400, uid + " not found")
                             return
+                        elif paths[0] == "events":
+                            self.send_events(task)
+                            return
                         else:
-                            self.send_json(task.get())
+                            try:
+                                wait = float(query.get("wait", ["0"])[0])
+                            except ValueError:
+                                wait = math.nan
+                            if not math.isfinite(wait) or wait < 0:
+                                self.send_text(400, "wait must be a non-negative number of seconds")
+                                return
+                            if wait > 0:
+                                # long-poll: ответ после смены статуса или по истечении wait
+                                if not self.wait_slot():
+                                    return
+                                try:
+                                    status = query.get(STATUS, [task.get()[STATUS]])[0]
+                                    task.wait_status(status, min(wait, LONG_POLL_MAX))
+                                finally:
+                                    self.server.waiters.release()
+                            self.send_result(task, query)
                             return
                     #
                 self.send_text(400, "wait /result/f50ec0b7-f960-400d-91f0-c42a6d44e3d0")
                 return
             #
 
-            self.send_text("Hello, world!")
+            self.send_text(200, "Hello, world!")
         except Exception as e:
             logger.exception(e)
             self.send_text(500, starter.exception_str(e))
@@ -57,6 +223,17 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             logger.info(self.path + ", Content-Length=" + str(content_length))
 
             input = json.loads(body)
+            if urlsplit(self.path).path == "/problem":
+                check_json.check_problem(input)
+                self.send_json(starter.problem_add(input))
+                return
+
+            if urlsplit(self.path).path == "/batch":
+                check_json.check_batch(input)
+                uids = starter.task_add_batch(input)
+                self.send_json(uids)
+                return
+
             check_json.check(input)
             uid = starter.task_add(input)
             self.send_text(200, uid)
@@ -71,6 +248,15 @@ class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
             logger.exception(e)
             self.send_text(500, starter.exception_str(e))
 
-httpd = HTTPServer(('0.0.0.0', 3356), SimpleHTTPRequestHandler)
-logger.info("server start forever")
-httpd.serve_forever()
\ No newline at end of file
+def stop(signum, frame):
+    logger.info("server shutdown, signal " + str(signum))
+    # shutdown() нельзя вызывать из потока serve_forever
+    threading.Thread(target=httpd.shutdown).start()
+
+httpd = ThreadPoolHTTPServer(('0.0.0.0', 3356), SimpleHTTPRequestHandler, HTTP_WORKERS, HTTP_WAITERS)
+signal.signal(signal.SIGTERM, stop)
+signal.signal(signal.SIGINT, stop)
+logger.info("server start forever, workers: " + str(HTTP_WORKERS) + ", waiters: " + str(HTTP_WAITERS))
+httpd.serve_forever()
+httpd.server_close()
+logger.info("server stopped, waiting for running tasks")
@@ -0,0 +1,152 @@
+from globals import *
+import threading
+
+# Метрики в текстовом формате Prometheus.
+# У каждой метрики своя блокировка, блокировка планировщика при сборе не нужна.
+
+# Границы корзин гистограмм, секунды
+TIME_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+def format_labels(names: list, values: tuple) -> str:
+    if len(names) == 0:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(name + "=\"" + value + "\"")
+    return "{" + ",".join(pairs) + "}"
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: list = []) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def samples(self) -> list:
+        # [(суффикс имени, значения меток, имена меток, значение)]
+        return []
+
+    def render(self) -> list:
+        lines = [
+            "# HELP " + self.name + " " + self.help,
+            "# TYPE " + self.name + " " + self.type
+        ]
+        for suffix, names, values, value in self.samples():
+            lines.append(self.name + suffix + format_labels(names, values) + " " + format_value(value))
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: list = []) -> None:
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.lock.acquire()
+        try:
+            self.values[labels] = self.values.get(labels, 0) + amount
+        finally:
+            self.lock.release()
+
+    def samples(self) -> list:
+        self.lock.acquire()
+        try:
+            return [("", self.labels, labels, value) for labels, value in sorted(self.values.items())]
+        finally:
+            self.lock.release()
+
+
+class Gauge(Metric):
+    # значения считываются функцией collect в момент запроса /metrics
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: list = [], collect = None) -> None:
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self.values = {}
+
+    def set(self, value: float, *labels):
+        self.lock.acquire()
+        try:
+            self.values[labels] = value
+        finally:
+            self.lock.release()
+
+    def samples(self) -> list:
+        if self.collect:
+            values = self.collect()
+        else:
+            self.lock.acquire()
+            try:
+                values = dict(self.values)
+            finally:
+                self.lock.release()
+        return [("", self.labels, labels, value) for labels, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: list = [], buckets: list = TIME_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = list(buckets) + [float("inf")]
+        self.values = {} # метки -> [счетчики корзин, сумма, количество]
+
+    def observe(self, value: float, *labels):
+        self.lock.acquire()
+        try:
+            data = self.values.get(labels)
+            if data is None:
+                data = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[0][i] += 1
+                    break
+            data[1] += value
+            data[2] += 1
+        finally:
+            self.lock.release()
+
+    def samples(self) -> list:
+        self.lock.acquire()
+        try:
+            values = [(labels, list(data[0]), data[1], data[2]) for labels, data in sorted(self.values.items())]
+        finally:
+            self.lock.release()
+
+        result = []
+        bucket_names = self.labels + ["le"]
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                result.append(("_bucket", bucket_names, labels + (format_value(bound),), cumulative))
+            result.append(("_sum", self.labels, labels, total))
+            result.append(("_count", self.labels, labels, count))
+        return result
+
+
+registry = []
+
+def render() -> str:
+    lines = []
+    for metric in list(registry):
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+queue_wait = Histogram("checker_queue_wait_seconds", "Time from submission to dispatch", ["priority"])
+container_time = Histogram("checker_container_seconds", "Container lifecycle stage duration", ["stage", "backend"])
+phase_time = Histogram("checker_phase_seconds", "Task phase duration", ["phase", "language"])
+results = Counter("checker_results_total", "Finished tasks by last phase and status", ["phase", "status"])
@@ -0,0 +1,208 @@
+from globals import *
+import collections
+
+# Разбор вывода контейнера по одной строке: работа на строку не зависит от объема вывода
+
+# Сколько первых и последних строк вывода и ошибок сохраняется в результате
+LOG_HEAD_LINES = int(os.environ.get("LOG_HEAD_LINES", "200"))
+LOG_TAIL_LINES = int(os.environ.get("LOG_TAIL_LINES", "200"))
+# Наибольшая длина одной строки, символы
+LOG_LINE_LIMIT = int(os.environ.get("LOG_LINE_LIMIT", "4096"))
+
+class LogBuffer:
+    # первые LOG_HEAD_LINES строк и кольцевой буфер последних LOG_TAIL_LINES
+    def __init__(self) -> None:
+        self.head = []
+        self.tail = collections.deque(maxlen=LOG_TAIL_LINES)
+        self.skipped = 0
+        self.truncated = False
+
+    def append(self, line: str):
+        if len(line) > LOG_LINE_LIMIT:
+            line = line[:LOG_LINE_LIMIT] + "..."
+            self.truncated = True
+        if len(self.head) < LOG_HEAD_LINES:
+            self.head.append(line)
+            return
+        if len(self.tail) == self.tail.maxlen:
+            self.skipped += 1
+            self.truncated = True
+        self.tail.append(line)
+
+    def text(self) -> str:
+        lines = list(self.head)
+        if self.skipped > 0:
+            lines.append("... " + str(self.skipped) + " lines skipped ...")
+        return "\n".join(lines + list(self.tail))
+
+
+class Parser:
+    def __init__(self) -> None:
+        self.output = LogBuffer()
+
+    def feed(self, line: str):
+        self.output.append(line)
+
+    def get_output(self) -> str:
+        return self.output.text()
+
+    def result(self) -> dict:
+        return {
+            "output": self.get_output(),
+            "output_truncated": self.output.truncated
+        }
+
+
+class BuildParser(Parser):
+    pass
+
+
+class RunParser(Parser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.errors = LogBuffer()
+        self.statistics = dict(
+            run_samples = 0,
+            last_sample = 0,
+            output = "",
+            time_max = 0,
+            time_min = 0,
+            time_avg = 0,
+            mem_max = 0,
+            mem_min = 0,
+            mem_avg = 0,
+            cpu_max = 0,
+            cpu_min = 0,
+            cpu_avg = 0,
+        )
+        # по каждому примеру, если время замерено runstat: user, sys, wall в микросекундах
+        self.sample_stats = []
+
+    def feed(self, line: str):
+        result = self.statistics
+        if line.startswith("sample: "):
+            result["run_samples"] += 1
+            result["last_sample"] = int(line[8:])
+            self.errors = LogBuffer()
+        elif line.startswith("mem: "):
+            sample = {}
+            for p in line.split(";"):
+                if p.startswith("mem: "):
+                    mem = int(p[5:])
+                    result["mem_max"] = max(result["mem_max"], mem)
+                    if result["mem_min"] == 0:
+                        result["mem_min"] = mem
+                    else:
+                        result["mem_min"] = min(result["mem_min"], mem)
+                    result["mem_avg"] += mem
+                elif p.startswith("time: "):
+                    t = float(p[6:])
+                    result["time_max"] = max(result["time_max"], t)
+                    if result["time_min"] == 0:
+                        result["time_min"] = t
+                    else:
+                        result["time_min"] = min(result["time_min"], t)
+                    result["time_avg"] += t
+                elif p.startswith(("user: ", "sys: ", "wall: ")):
+                    name, value = p.split(": ", 1)
+                    sample[name] = int(value)
+            if "user" in sample:
+                cpu = (sample["user"] + sample.get("sys", 0)) / 1000000
+                result["cpu_max"] = max(result["cpu_max"], cpu)
+                if result["cpu_min"] == 0:
+                    result["cpu_min"] = cpu
+                else:
+                    result["cpu_min"] = min(result["cpu_min"], cpu)
+                result["cpu_avg"] += cpu
+                sample["sample"] = result["last_sample"]
+                sample["mem"] = mem
+                self.sample_stats.append(sample)
+        elif not line.startswith("debug: "):
+            self.errors.append(line)
+        self.output.append(line.replace("debug: ", ""))
+
+    def result(self) -> dict:
+        result = dict(self.statistics)
+        result["output"] = self.get_output()
+        result["output_truncated"] = self.output.truncated
+        result["errors"] = self.errors.text()
+        result["errors_truncated"] = self.errors.truncated
+        # примеры могут запускаться не по порядку, в результате - по номерам
+        result["sample_stats"] = sorted(self.sample_stats, key=lambda s: s["sample"])
+        if result["run_samples"] > 0:
+            result["mem_avg"] = result["mem_avg"] / result["run_samples"]
+            result["time_avg"] = result["time_avg"] / result["run_samples"]
+        if len(self.sample_stats) > 0:
+            result["cpu_avg"] = result["cpu_avg"] / len(self.sample_stats)
+        return result
+
+
+class CheckParser(Parser):
+    def __init__(self, statistics: dict) -> None:
+        super().__init__()
+        self.errors = LogBuffer()
+        self.statistics = dict(statistics)
+
+    def feed(self, line: str):
+        if line.startswith("sample: "):
+            self.statistics["last_sample"] = int(line[8:])
+            self.errors = LogBuffer()
+        elif not line.startswith("debug: "):
+            self.errors.append(line)
+        self.output.append(line.replace("debug: ", ""))
+
+    def result(self) -> dict:
+        result = dict(self.statistics)
+        result["output"] = self.get_output()
+        result["output_truncated"] = self.output.truncated
+        result["errors"] = self.errors.text()
+        result["errors_truncated"] = self.errors.truncated
+        return result
+
+
+def merge_run(results: list, failed: dict = None) -> dict:
+    # объединение результатов RunParser нескольких частей в один, как при последовательном запуске
+    result = dict(
+        run_samples = 0,
+        last_sample = 0,
+        output = "",
+        time_max = 0,
+        time_min = 0,
+        time_avg = 0,
+        mem_max = 0,
+        mem_min = 0,
+        mem_avg = 0,
+        cpu_max = 0,
+        cpu_min = 0,
+        cpu_avg = 0,
+    )
+    sample_stats = []
+    for r in results:
+        result["run_samples"] += r["run_samples"]
+        sample_stats += r["sample_stats"]
+        result["cpu_avg"] += r["cpu_avg"] * len(r["sample_stats"])
+        for name in ["time", "mem", "cpu"]:
+            result[name + "_max"] = max(result[name + "_max"], r[name + "_max"])
+            if r[name + "_min"] != 0:
+                if result[name + "_min"] == 0:
+                    result[name + "_min"] = r[name + "_min"]
+                else:
+                    result[name + "_min"] = min(result[name + "_min"], r[name + "_min"])
+            if name != "cpu":
+                result[name + "_avg"] += r[name + "_avg"] * r["run_samples"]
+
+    result["output"] = "\n".join([r["output"] for r in results])
+    result["output_truncated"] = any(r["output_truncated"] for r in results)
+    result["errors"] = ""
+    result["errors_truncated"] = False
+    if failed:
+        result["last_sample"] = failed["last_sample"]
+        result["errors"] = failed["errors"]
+        result["errors_truncated"] = failed["errors_truncated"]
+    result["sample_stats"] = sorted(sample_stats, key=lambda s: s["sample"])
+    if result["run_samples"] > 0:
+        result["mem_avg"] = result["mem_avg"] / result["run_samples"]
+        result["time_avg"] = result["time_avg"] / result["run_samples"]
+    if len(sample_stats) > 0:
+        result["cpu_avg"] = result["cpu_avg"] / len(sample_stats)
+    return result
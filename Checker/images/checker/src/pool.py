@@ -0,0 +1,274 @@
+from globals import *
+from docker.types import Mount
+from workspace import Workspace, WORKDIR, clear_dir
+import dockerapi
+import shutil
+import threading
+import time
+import uuid
+
+logger = log("pool")
+
+# Размеры пулов по образам: "python:checker=2,gcc:builder=1"
+CONTAINER_POOL = os.environ.get("CONTAINER_POOL", "")
+# Через сколько секунд простоя пул сжимается до нуля
+CONTAINER_POOL_IDLE = int(os.environ.get("CONTAINER_POOL_IDLE", "300"))
+# Сколько прогретых песочниц сборки остается в пуле после простоя
+CONTAINER_POOL_IDLE_BUILDERS = int(os.environ.get("CONTAINER_POOL_IDLE_BUILDERS", "1"))
+# Пользователь, от которого выполняются фазы с read_only (тестируемая программа, проверка)
+CONTAINER_POOL_USER = os.environ.get("CONTAINER_POOL_USER", "65534:65534")
+# Процессы, которые могут остаться между фазами сборки (без read_only): серверы компиляторов.
+# В песочницах тестируемых программ и проверок любой лишний процесс - повод удалить контейнер.
+CONTAINER_POOL_RESIDENT = os.environ.get("CONTAINER_POOL_RESIDENT", "VBCSCompiler,MSBuild.dll")
+POOL_DIR = "pool"
+# Скрипт прогрева в образе: заранее созданная песочница сборки выполняет его один раз,
+# запускает резидентные серверы компиляторов и загружает компилятор в кэш страниц
+WARMUP = "/usr/local/bin/checker-warmup"
+
+def parse_sizes(value: str) -> dict:
+    sizes = {}
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            image, size = item.rsplit("=", 1)
+            sizes[image.strip()] = int(size)
+    return sizes
+
+def parse_list(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+RESIDENT = parse_list(CONTAINER_POOL_RESIDENT)
+
+class Sandbox:
+    def __init__(self, client, key: tuple, warm: bool = False) -> None:
+        self.client = client
+        self.key = key
+        self.name = str(uuid.uuid4())
+        self.starter_path = path_join(path_join(workspace_starter(), POOL_DIR), self.name)
+        self.docker_path = path_join(path_join(workspace_docker(), POOL_DIR), self.name)
+        self.released = time.monotonic()
+        self.workspace = Workspace(self.starter_path, "pooled sandbox")
+        self.exec_id = None
+
+        os.makedirs(self.starter_path)
+        os.chmod(self.starter_path, 0o1777)
+
+        image_name, readonly, mem_limit, memswap_limit = key
+        kwargs = {
+            MOUNTS: [Mount(WORKDIR, self.docker_path, type="bind", read_only=False)],
+            MEM_LIMIT: mem_limit,
+            MEMSWAP_LIMIT: memswap_limit,
+            "pids_limit": -1,
+            "tty": False,
+            "stdin_open": False,
+            READONLY: readonly,
+            "entrypoint": ["/bin/bash"],
+            "network_disabled": True,
+            "working_dir": WORKDIR
+        }
+        try:
+            self.container = self.client.containers.create(image_name, command=["-c", "while :; do sleep 3600; done"], **kwargs)
+            self.container.start()
+        except:
+            shutil.rmtree(self.starter_path, ignore_errors=True)
+            raise
+        logger.debug("image: " + image_name + ", sandbox: " + self.container.name)
+        if warm and not readonly:
+            self.warmup()
+
+    def warmup(self):
+        # вывод - в /dev/null: резидентные процессы не должны держать поток exec
+        try:
+            result = self.container.exec_run(
+                ["/bin/bash", "-c", "if [ -x " + WARMUP + " ]; then " + WARMUP + " </dev/null >/dev/null 2>&1; fi"],
+                workdir="/tmp"
+            )
+            logger.debug("sandbox " + self.name + " warmup: " + str(result.exit_code))
+        except Exception as e:
+            logger.warning("sandbox " + self.name + " warmup: " + str(e))
+
+    def materialize(self, options: dict):
+        self.workspace.materialize(options.get(MOUNTS, []))
+
+    def collect(self):
+        self.workspace.collect()
+
+    def execute(self, options: dict):
+        user = options.get(USER) or (CONTAINER_POOL_USER if options.get(READONLY, False) else "")
+        self.exec_id = self.client.api.exec_create(
+            self.container.id, ["/bin/bash", options["command"]],
+            stdout=True, stderr=True, tty=False, workdir=WORKDIR, user=user
+        )["Id"]
+        out = self.client.api.exec_start(self.exec_id, stream=True)
+
+        # поток exec не разбит на строки
+        rest = b""
+        for chunk in out:
+            rest += chunk
+            while True:
+                i = rest.find(b"\n")
+                if i < 0:
+                    break
+                yield rest[:i + 1]
+                rest = rest[i + 1:]
+            if len(rest) > LINE_READ_LIMIT:
+                # строка без перевода строки не накапливается в памяти
+                yield rest
+                rest = b""
+        if rest:
+            yield rest
+
+    def exit_code(self) -> int:
+        return self.client.api.exec_inspect(self.exec_id)["ExitCode"]
+
+    def clean(self) -> bool:
+        # после фазы в контейнере должны остаться только bash и sleep
+        try:
+            self.container.reload()
+            if self.container.attrs["State"]["Status"] != "running":
+                return False
+            if self.processes() > 2:
+                return False
+            clear_dir(self.starter_path)
+            return True
+        except Exception as e:
+            logger.warning("sandbox " + self.name + ": " + str(e))
+            return False
+
+    def processes(self) -> int:
+        # число процессов без разрешенных резидентных
+        top = self.container.top()
+        rows = top.get("Processes") or []
+        titles = top.get("Titles") or []
+        readonly = self.key[1]
+        if readonly or not "CMD" in titles:
+            return len(rows)
+        i = titles.index("CMD")
+        return len([row for row in rows if not any(name in row[i] for name in RESIDENT)])
+
+    def destroy(self):
+        dockerapi.remove(self.container.id)
+        shutil.rmtree(self.starter_path, ignore_errors=True)
+
+
+class Pool:
+    def __init__(self, key: tuple, size: int) -> None:
+        self.key = key
+        self.size = size
+        self.idle = []
+        self.used = time.monotonic()
+
+
+class PoolManager:
+    def __init__(self, sizes: dict) -> None:
+        self.sizes = sizes
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.client = None
+        # пулы сборки (без read_only и ограничений памяти) заполняются прогретыми песочницами
+        # сразу при запуске; пулы остальных фаз - после первой задачи
+        for image_name, size in sizes.items():
+            if size > 0:
+                key = (image_name, False, None, None)
+                self.pools[key] = Pool(key, size)
+
+    def enabled(self, options: dict) -> bool:
+        return self.sizes.get(options["image_name"], 0) > 0
+
+    def get_client(self):
+        if self.client is None:
+            self.client = dockerapi.client()
+        return self.client
+
+    def pool_key(self, options: dict) -> tuple:
+        if not options.get(READONLY, False):
+            # сборка: ограничения памяти тестируемой программы к компилятору не относятся,
+            # все сборки образа идут в один заранее созданный пул
+            return (options["image_name"], False, None, None)
+        return (options["image_name"], True, options.get(MEM_LIMIT), options.get(MEMSWAP_LIMIT))
+
+    def acquire(self, options: dict) -> Sandbox:
+        key = self.pool_key(options)
+        self.lock.acquire()
+        try:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = self.pools[key] = Pool(key, self.sizes[options["image_name"]])
+            pool.used = time.monotonic()
+            if len(pool.idle) > 0:
+                return pool.idle.pop()
+        finally:
+            self.lock.release()
+        logger.debug("pool " + str(key) + " is empty")
+        return Sandbox(self.get_client(), key)
+
+    def release(self, sandbox: Sandbox, healthy: bool):
+        if healthy and sandbox.clean():
+            self.lock.acquire()
+            try:
+                pool = self.pools[sandbox.key]
+                if len(pool.idle) < pool.size:
+                    sandbox.released = time.monotonic()
+                    pool.idle.append(sandbox)
+                    return
+            finally:
+                self.lock.release()
+        sandbox.destroy()
+
+    def maintain(self):
+        now = time.monotonic()
+        create = []
+        remove = []
+        self.lock.acquire()
+        try:
+            for key, pool in self.pools.items():
+                builder = not pool.key[1]
+                target = pool.size if now - pool.used < CONTAINER_POOL_IDLE else \
+                    (min(pool.size, CONTAINER_POOL_IDLE_BUILDERS) if builder else 0)
+                while len(pool.idle) > target:
+                    remove.append(pool.idle.pop(0))
+                if len(pool.idle) < target:
+                    create.append((pool, target - len(pool.idle)))
+        finally:
+            self.lock.release()
+
+        for sandbox in remove:
+            logger.debug("shrink " + str(sandbox.key))
+            sandbox.destroy()
+        for pool, count in create:
+            for _ in range(count):
+                try:
+                    sandbox = Sandbox(self.get_client(), pool.key, True)
+                except Exception as e:
+                    logger.warning("pool " + str(pool.key) + ": " + str(e))
+                    break
+                self.lock.acquire()
+                try:
+                    pool.idle.append(sandbox)
+                finally:
+                    self.lock.release()
+
+    def wait(self):
+        while True:
+            try:
+                self.maintain()
+            except Exception as e:
+                logger.exception(e)
+            time.sleep(1)
+
+
+manager = PoolManager(parse_sizes(CONTAINER_POOL))
+if len(manager.sizes) > 0:
+    shutil.rmtree(path_join(workspace_starter(), POOL_DIR), ignore_errors=True)
+    logger.info("pool sizes: " + str(manager.sizes))
+    t = threading.Thread(target=manager.wait, daemon=True)
+    t.start()
+
+def enabled(options: dict) -> bool:
+    return manager.enabled(options)
+
+def acquire(options: dict) -> Sandbox:
+    return manager.acquire(options)
+
+def release(sandbox: Sandbox, healthy: bool):
+    manager.release(sandbox, healthy)
@@ -0,0 +1,189 @@
+from globals import *
+import hashlib
+import json
+import shutil
+import threading
+
+import checker
+from shared import SharedChecker
+
+logger = log("problems")
+
+# Зарегистрированные задачи: примеры и собранная проверка хранятся на диске
+PROBLEMS_STARTER = os.environ.get("PROBLEMS_STARTER") or path_join(starter_temp(), "problems")
+PROBLEMS_DOCKER = os.environ.get("PROBLEMS_DOCKER") or path_join(docker_temp(), "problems")
+PROBLEM_FILE = "problem.json"
+
+class Problem(SharedChecker):
+    KEEP = ["samples", PROBLEM_FILE]
+
+    def __init__(self, uid: str, data: dict) -> None:
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.building = False
+        # свой замок у примеров: self.lock занят на время ожидания сборки проверки
+        self.samples_lock = threading.Lock()
+        self.uid = uid
+        self.members = 0
+        self.starter_path = path_join(PROBLEMS_STARTER, uid)
+        self.docker_path = path_join(PROBLEMS_DOCKER, uid)
+        self.samples_dir = path_join(self.docker_path, "samples")
+        self.limits = data.get(LIMITS, {})
+        self.count = data["samples_count"]
+        self.samples = None
+        self.stats_key = uid
+
+        self.options = dict(data[CHECKER])
+        self.options[STARTER_TEMP] = self.starter_path
+        self.options[DOCKER_TEMP] = self.docker_path
+
+        build = data.get(BUILD)
+        # сохраненная неудачная сборка не по ошибке компиляции (прежние версии) повторяется
+        self.built = not build is None and (build["ok"] or build.get(STATUS) == ERROR)
+        self.build_ok = False
+        self.build_status = None
+        self.build_result = None
+        if self.built:
+            self.build_ok = build["ok"]
+            self.build_status = build.get(STATUS)
+            self.build_result = build.get(RESULT)
+            if self.build_ok:
+                self.options["bin_path"] = build["bin_path"]
+                self.options[CMD] = build[CMD]
+
+    def get_samples(self) -> list:
+        # тексты примеров нужны только для оценки их стоимости при разбиении на части
+        self.samples_lock.acquire()
+        try:
+            if self.samples is None:
+                samples = []
+                for i in range(1, self.count + 1):
+                    with open(path_join(path_join(self.starter_path, "samples"), checker.sample_name("input", i)), "r", newline="\n") as f:
+                        samples.append(f.read())
+                self.samples = samples
+            return self.samples
+        finally:
+            self.samples_lock.release()
+
+    def data(self) -> dict:
+        data = {
+            CHECKER: checker.checker_spec(self.options),
+            LIMITS: self.limits,
+            "samples_count": self.count
+        }
+        if self.built:
+            build = {
+                "ok": self.build_ok
+            }
+            if self.build_ok:
+                build["bin_path"] = self.options["bin_path"]
+                build[CMD] = self.options[CMD]
+            else:
+                build[STATUS] = self.build_status
+                build[RESULT] = self.build_result
+            data[BUILD] = build
+        return data
+
+    def info(self) -> dict:
+        return {
+            PROBLEM: self.uid,
+            LANGUAGE: self.options.get(LANGUAGE),
+            COMPARE: self.options.get(COMPARE),
+            LIMITS: self.limits,
+            "samples_count": self.count,
+            "built": self.built,
+            "build_ok": self.build_ok
+        }
+
+    def save(self):
+        # вызывается под self.lock
+        tmp = path_join(self.starter_path, PROBLEM_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.data(), f, default=str)
+        os.replace(tmp, path_join(self.starter_path, PROBLEM_FILE))
+
+    def release(self):
+        pass
+
+    def submission(self, input: dict) -> dict:
+        # полный запрос на проверку из testee и зарегистрированной задачи
+        result = dict(input)
+        testee = result[TESTEE] = dict(input[TESTEE])
+        for name in [TIMEOUT, MEM_LIMIT, TIMEOUT_MODE, OUTPUT_LIMIT]:
+            if not name in testee and name in self.limits:
+                testee[name] = self.limits[name]
+        result[CHECKER] = checker.checker_spec(self.options)
+        result[SAMPLES] = self.get_samples()
+        return result
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.problems = {}
+        os.makedirs(PROBLEMS_STARTER, exist_ok=True)
+
+    def problem_id(self, input: dict) -> str:
+        h = hashlib.sha256()
+        spec = checker.checker_spec(input[CHECKER])
+        values = [spec[LANGUAGE], spec[SOURCE]] if SOURCE in spec else [json.dumps(spec, sort_keys=True)]
+        for value in values + input[SAMPLES]:
+            if not isinstance(value, str):
+                value = json.dumps(value, sort_keys=True)
+            h.update(value.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()[:32]
+
+    def register(self, input: dict) -> tuple:
+        # возвращает (задача, новая ли она)
+        uid = self.problem_id(input)
+        problem = self.get(uid)
+        if not problem is None:
+            return problem, False
+
+        self.lock.acquire()
+        try:
+            problem = self.problems.get(uid)
+            if not problem is None:
+                return problem, False
+
+            starter_path = path_join(PROBLEMS_STARTER, uid)
+            shutil.rmtree(starter_path, ignore_errors=True)
+            os.makedirs(path_join(starter_path, "samples"))
+            checker.write_samples(path_join(starter_path, "samples"), input[SAMPLES])
+            problem = Problem(uid, {
+                CHECKER: checker.checker_spec(input[CHECKER]),
+                LIMITS: input.get(LIMITS, {}),
+                "samples_count": len(input[SAMPLES])
+            })
+            problem.samples = list(input[SAMPLES])
+            problem.save()
+            self.problems[uid] = problem
+            logger.info("problem " + uid + ", samples: " + str(problem.count))
+            return problem, True
+        finally:
+            self.lock.release()
+
+    def get(self, uid: str) -> Problem:
+        self.lock.acquire()
+        try:
+            problem = self.problems.get(uid)
+            if problem is None:
+                filename = path_join(path_join(PROBLEMS_STARTER, os.path.basename(uid)), PROBLEM_FILE)
+                if not os.path.exists(filename):
+                    return None
+                with open(filename, "r") as f:
+                    problem = Problem(os.path.basename(uid), json.load(f))
+                self.problems[problem.uid] = problem
+            return problem
+        finally:
+            self.lock.release()
+
+
+registry = Registry()
+
+def register(input: dict) -> tuple:
+    return registry.register(input)
+
+def get(uid: str) -> Problem:
+    return registry.get(uid)
@@ -1,5 +1,67 @@
 from globals import *
 from docker.types import Mount
+import py_compile
+import subprocess
+import sys
+import threading
+
+import dockerapi
+import sandbox
+
+logger = log("python")
+
+# Исходник компилируется в байт-код один раз при сборке, примеры запускают bin/main.pyc.
+# Если версия Python сервиса совпадает с образом python:checker, небольшой исходник
+# компилируется в сервисе без контейнера, иначе - контейнером сборки в python:checker.
+# Тег образа (например, cpython-311) задается PYTHON_CACHE_TAG или определяется один раз
+# запуском python в образе; если определить не удалось - всегда контейнер сборки.
+PYTHON_CACHE_TAG = os.environ.get("PYTHON_CACHE_TAG", "")
+# Исходники больше этого размера компилируются только в контейнере:
+# компиляция в сервисе держит GIL и не ограничена по памяти и времени
+PYTHON_COMPILE_SIZE = parse_size(os.environ.get("PYTHON_COMPILE_SIZE", "256k"))
+# Путь исходника в контейнере: по нему traceback показывает строки программы
+SOURCE_PATH = "/usr/src/bin/main.py"
+
+COMPILE_SCRIPT = """import py_compile
+import sys
+try:
+    py_compile.compile(sys.argv[1], cfile=sys.argv[2], dfile=sys.argv[3], doraise=True)
+except py_compile.PyCompileError as e:
+    print(e.msg)
+    sys.exit(1)
+"""
+
+CACHE_TAG_SCRIPT = "import sys; print(sys.implementation.cache_tag)"
+
+lock = threading.Lock()
+image_tag = None
+
+def detect_cache_tag() -> str:
+    if sandbox.SANDBOX == "docker":
+        output = dockerapi.client().containers.run("python:checker", ["python", "-c", CACHE_TAG_SCRIPT],
+            entrypoint=[], remove=True, network_disabled=True)
+    elif sandbox.SANDBOX == "local":
+        output = subprocess.run(["python", "-c", CACHE_TAG_SCRIPT], stdout=subprocess.PIPE, check=True).stdout
+    else:
+        return sys.implementation.cache_tag
+    return output.decode("utf-8").strip()
+
+def cache_tag() -> str:
+    # тег байт-кода образа python:checker, определяется при первой сборке
+    global image_tag
+    lock.acquire()
+    try:
+        if image_tag is None:
+            image_tag = PYTHON_CACHE_TAG
+            if not image_tag:
+                try:
+                    image_tag = detect_cache_tag()
+                except Exception as e:
+                    logger.warning("python:checker cache tag: " + str(e))
+            logger.info("python:checker cache tag: " + image_tag + ", service: " + sys.implementation.cache_tag)
+        return image_tag
+    finally:
+        lock.release()
 
 def prepare_build(options: dict, name: str) -> bool:
     starter_tmp = options[STARTER_TEMP]
@@ -8,13 +70,43 @@ def prepare_build(options: dict, name: str) -> bool:
     os.makedirs(bin_path)
 
     filename = path_join(bin_path, "main.py")
-    with open(path_join(starter_tmp, filename), "x", newline="\n") as f:
+    with open(filename, "x", newline="\n") as f:
         f.write(options[SOURCE])
 
-    options["bin_path"] = bin_path
-    options[CMD] = "python bin/main.py"
+    options["bin_path"] = name
+    options[CMD] = "python bin/main.pyc"
+
+    if len(options[SOURCE].encode("utf-8")) <= PYTHON_COMPILE_SIZE and cache_tag() == sys.implementation.cache_tag:
+        try:
+            py_compile.compile(filename, cfile=path_join(bin_path, "main.pyc"), dfile=SOURCE_PATH, doraise=True)
+        except py_compile.PyCompileError as e:
+            raise BuildError(e.msg)
+        return False
+
+    options["image_name"] = "python:checker"
+    options[MOUNTS] = mounts = []
+    docker_tmp = options[DOCKER_TEMP]
+    mounts.append(Mount("/usr/src", docker_tmp, type="bind", read_only=False))
+
+    cmd = ["#!/bin/bash"]
+    options["commands"] = cmd
+    compile_filename = "compile_" + name + ".py"
+    with open(path_join(starter_tmp, compile_filename), "x", newline="\n") as f:
+        f.write(COMPILE_SCRIPT)
+    cmd_debug(cmd, "python " + compile_filename + " " + name + "/main.py " + name + "/main.pyc " + SOURCE_PATH)
+    cmd.append("retVal=$?")
+    cmd.append("if [ $retVal -ne 0 ]; then")
+    cmd.append("  exit $retVal")
+    cmd.append("fi")
+    cmd.append('echo "debug: build success"')
+
+    s = "\n".join(cmd)
+    command_filename = "build_" + name + ".sh"
+    with open(path_join(starter_tmp, command_filename), "x", newline="\n") as f:
+        f.write(s)
+    options["command"] = command_filename
 
-    return False
+    return True
 
 def prepare_run(options: dict):
     options["image_name"] = "python:checker"
@@ -24,4 +116,4 @@ def prepare_run(options: dict):
     options[MOUNTS] = mounts = []
 
     docker_tmp = options[DOCKER_TEMP]
-    mounts.append(Mount("/usr/src/bin", path_join(docker_tmp, options["bin_path"]), type="bind", read_only=True))
\ No newline at end of file
+    mounts.append(Mount("/usr/src/bin", path_join(docker_tmp, options["bin_path"]), type="bind", read_only=True))
@@ -0,0 +1,76 @@
+from globals import *
+from docker.types import Mount
+import shutil
+
+logger = log("runstat")
+
+# Замер ресурсов каждого примера через wait4 (Checker/images/checker/runstat/runstat.c).
+# Статически собранный runstat копируется в общий с контейнерами временный каталог
+# и подключается в рабочий каталог, поэтому работает в любом образе.
+# Если его нет, используется GNU time, как раньше.
+RUNSTAT = os.environ.get("RUNSTAT", "/usr/local/bin/runstat")
+RUNSTAT_DIR = "runstat"
+RUNSTAT_NAME = "runstat"
+
+def install() -> bool:
+    if not os.path.exists(RUNSTAT):
+        logger.info(RUNSTAT + " not found, using GNU time")
+        return False
+    path = path_join(starter_temp(), RUNSTAT_DIR)
+    os.makedirs(path, exist_ok=True)
+    tmp = path_join(path, RUNSTAT_NAME + ".tmp")
+    shutil.copy2(RUNSTAT, tmp)
+    # контейнеры, которые еще выполняют старую копию, ее не теряют
+    os.replace(tmp, path_join(path, RUNSTAT_NAME))
+    return True
+
+available = install()
+
+def mount(options: dict):
+    if available:
+        options[MOUNTS].append(Mount(path_join("/usr/src", RUNSTAT_NAME), path_join(path_join(docker_temp(), RUNSTAT_DIR), RUNSTAT_NAME), type="bind", read_only=True))
+
+def output_bytes(options: dict) -> int:
+    limit = parse_size(options.get(OUTPUT_LIMIT, DEFAULT_OUTPUT_LIMIT))
+    return limit if limit else 0
+
+def limit_output(options: dict, line: str) -> str:
+    # RLIMIT_FSIZE в подоболочке, в блоках по 1024 байта, на блок больше output_limit:
+    # вывод ровно в output_limit байт не считается превышением
+    limit = output_bytes(options)
+    if not limit:
+        return line
+    return "(ulimit -f " + str(limit // 1024 + 1) + " && " + line + ")"
+
+def check_output(options: dict) -> list:
+    # превышение - вывод длиннее output_limit: программа получила SIGXFSZ
+    # или, если игнорирует его (например, python), ошибку записи EFBIG
+    limit = output_bytes(options)
+    if not limit:
+        return []
+    return [
+        "if [ $(stat -c %s output.txt 2>/dev/null || echo 0) -gt " + str(limit) + " ]; then",
+        "  echo \"" + OUTPUT_LIMIT_MARKER + "\"",
+        "  retVal=" + str(EXIT_OUTPUT_LIMIT),
+        "fi"
+    ]
+
+def command(options: dict, cmd: str) -> list:
+    # команды запуска одного примера: input.txt на вход, вывод дописывается в output.txt,
+    # строка "mem: ...;time: ..." - в вывод контейнера
+    timeout = options[TIMEOUT]
+    if not available:
+        return [
+            limit_output(options, "cat input.txt | time --format=\"mem: %M;time: %e\" --output=stats.txt -q timeout " + str(timeout) + " " + cmd + " >> output.txt"),
+            "retVal=$?",
+            "cat stats.txt"
+        ] + check_output(options)
+    if options.get(TIMEOUT_MODE, WALL) == CPU:
+        # астрономическое время ограничивается с запасом, чтобы не ждать спящую программу вечно
+        limits = "-c " + str(timeout) + " -w " + str(float(timeout) * 2 + 1)
+    else:
+        limits = "-w " + str(timeout)
+    return [
+        limit_output(options, "./" + RUNSTAT_NAME + " " + limits + " -- " + cmd + " < input.txt >> output.txt"),
+        "retVal=$?"
+    ] + check_output(options)
@@ -0,0 +1,110 @@
+from globals import *
+from workspace import link_or_copy
+import hashlib
+import threading
+import time
+import uuid
+
+logger = log("samplestore")
+
+# Примеры хранятся один раз на каждое различное содержимое, по sha256.
+# Каталоги примеров задач состоят из жестких ссылок на файлы хранилища
+# и подключаются в контейнер одним монтированием, поэтому хранилище должно быть
+# в той же файловой системе, что и каталоги задач.
+SAMPLE_STORE = os.environ.get("SAMPLE_STORE") or path_join(workspace_starter(), "sample_store")
+# Через сколько секунд удаляется файл, на который больше нет ссылок
+SAMPLE_STORE_TTL = int(os.environ.get("SAMPLE_STORE_TTL", "3600"))
+
+# put и link выполняются под objects_lock вместе с удалением в collect:
+# файл не может пропасть между проверкой и созданием ссылки
+objects_lock = threading.Lock()
+lock = threading.Lock()
+# (st_dev, st_ino) файлов хранилища: только они не входят в квоту каталога задачи
+inodes = set()
+
+def register(path: str):
+    st = os.stat(path)
+    lock.acquire()
+    try:
+        inodes.add((st.st_dev, st.st_ino))
+    finally:
+        lock.release()
+
+def shared(st: os.stat_result) -> bool:
+    lock.acquire()
+    try:
+        return (st.st_dev, st.st_ino) in inodes
+    finally:
+        lock.release()
+
+def object_path(digest: str) -> str:
+    return path_join(path_join(SAMPLE_STORE, digest[:2]), digest)
+
+def put(sample: str) -> str:
+    # вызывается под objects_lock
+    data = sample.encode("utf-8")
+    path = object_path(hashlib.sha256(data).hexdigest())
+    try:
+        # свежее время изменения защищает файл от удаления в collect
+        os.utime(path)
+        register(path)
+        return path
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + "." + str(uuid.uuid4()) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.chmod(tmp, 0o444)
+    os.replace(tmp, path)
+    register(path)
+    return path
+
+def link(sample: str, dst: str):
+    objects_lock.acquire()
+    try:
+        link_or_copy(put(sample), dst)
+    finally:
+        objects_lock.release()
+
+def collect() -> int:
+    # удаляет файлы без ссылок из каталогов задач
+    removed = 0
+    deadline = time.time() - SAMPLE_STORE_TTL
+    for root, dirs, files in os.walk(SAMPLE_STORE):
+        for name in files:
+            path = os.path.join(root, name)
+            objects_lock.acquire()
+            try:
+                st = os.stat(path)
+                if st.st_nlink == 1 and st.st_mtime < deadline:
+                    os.unlink(path)
+                    lock.acquire()
+                    try:
+                        inodes.discard((st.st_dev, st.st_ino))
+                    finally:
+                        lock.release()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+            finally:
+                objects_lock.release()
+    return removed
+
+def wait():
+    while True:
+        time.sleep(max(SAMPLE_STORE_TTL / 4, 60))
+        try:
+            removed = collect()
+            if removed > 0:
+                logger.info("removed: " + str(removed))
+        except Exception as e:
+            logger.exception(e)
+
+os.makedirs(SAMPLE_STORE, exist_ok=True)
+for root, dirs, files in os.walk(SAMPLE_STORE):
+    for name in files:
+        if not name.endswith(".tmp"):
+            register(os.path.join(root, name))
+t = threading.Thread(target=wait, daemon=True)
+t.start()
@@ -0,0 +1,304 @@
+from globals import *
+from workspace import Workspace
+import signal
+import subprocess
+import time
+import uuid
+
+import dockerapi
+import pool
+import taskdir
+
+logger = log("sandbox")
+
+# docker - контейнер на фазу (или контейнер из пула, если он задан для образа),
+# local - процессы на этой машине, только для доверенных программ,
+# fake - поддельная песочница для замеров без Docker
+SANDBOX = os.environ.get("SANDBOX", "docker")
+
+# local: сетевое пространство имен через unshare: auto - если доступно, 0 - нет
+LOCAL_UNSHARE = os.environ.get("LOCAL_UNSHARE", "auto")
+LOCAL_DIR = "local"
+
+# fake: время создания и удаления контейнера и одного примера, секунды; строк вывода на пример
+FAKE_CONTAINER_TIME = float(os.environ.get("FAKE_CONTAINER_TIME", "0.05"))
+FAKE_SAMPLE_TIME = float(os.environ.get("FAKE_SAMPLE_TIME", "0.01"))
+FAKE_OUTPUT_LINES = int(os.environ.get("FAKE_OUTPUT_LINES", "1"))
+
+class Backend:
+    # Песочница одной фазы. container.run вызывает по порядку:
+    # prepare, materialize, start, output, wait, collect, stats и в конце всегда destroy.
+    # kill может быть вызван из другого потока после start.
+    name = ""
+
+    def __init__(self, options: dict) -> None:
+        self.options = options
+
+    def prepare(self):
+        pass
+
+    def materialize(self):
+        pass
+
+    def start(self):
+        pass
+
+    def output(self):
+        return []
+
+    def wait(self) -> int:
+        return 0
+
+    def collect(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "oom_killed": False
+        }
+
+    def kill(self):
+        pass
+
+    def destroy(self):
+        pass
+
+    def workspace_path(self) -> str:
+        # каталог, в который пишет программа во время фазы, если он не каталог задачи
+        return None
+
+
+class DockerBackend(Backend):
+    name = "docker"
+
+    def __init__(self, options: dict) -> None:
+        super().__init__(options)
+        self.container = None
+        self.exit_code = None
+        self.oom_killed = False
+
+    def prepare(self):
+        options = self.options
+        client = dockerapi.client()
+        kwargs = {
+            #"auto_remove": True,
+            MOUNTS: options.get(MOUNTS, []),
+            MEM_LIMIT: options.get(MEM_LIMIT),
+            MEMSWAP_LIMIT: options.get(MEMSWAP_LIMIT),
+            "pids_limit": -1,
+            "tty": False,
+            "stdin_open": False,
+            READONLY: options.get(READONLY, False),
+            "entrypoint": ["/bin/bash"],
+            "network_disabled": True,
+            "working_dir": "/usr/src",
+            "labels": [dockerapi.LABEL]
+        }
+        self.container = client.containers.create(options["image_name"], command=options["command"], **kwargs)
+        logger.info("image: " + options["image_name"] + ", container: " + self.container.name)
+
+    def start(self):
+        self.container.start()
+
+    def output(self):
+        return self.container.logs(
+            stdout=True, stderr=True, stream=True, follow=True
+        )
+
+    def wait(self) -> int:
+        # код и OOM - из события die, без запроса состояния контейнера
+        self.exit_code, self.oom_killed = dockerapi.wait_exit(self.container)
+        return self.exit_code
+
+    def stats(self) -> dict:
+        return {
+            "oom_killed": self.oom_killed
+        }
+
+    def kill(self):
+        self.container.kill()
+
+    def destroy(self):
+        if self.container is None:
+            return
+        if self.exit_code is None:
+            # фаза прервана до завершения контейнера: остановить сразу, удалить в фоне
+            try:
+                self.container.kill()
+            except Exception as e:
+                logger.debug("kill: " + str(e))
+        dockerapi.remove(self.container.id)
+
+
+class PoolBackend(Backend):
+    name = "pool"
+
+    def __init__(self, options: dict) -> None:
+        super().__init__(options)
+        self.sandbox = None
+        self.healthy = False
+        self.exit_code = None
+
+    def prepare(self):
+        self.sandbox = pool.acquire(self.options)
+        logger.info("image: " + self.options["image_name"] + ", sandbox: " + self.sandbox.container.name)
+
+    def materialize(self):
+        self.sandbox.materialize(self.options)
+
+    def output(self):
+        return self.sandbox.execute(self.options)
+
+    def wait(self) -> int:
+        self.exit_code = self.sandbox.exit_code()
+        # контейнер, в котором сработал OOM, в пул не возвращается
+        self.healthy = self.exit_code != 137
+        return self.exit_code
+
+    def collect(self):
+        self.sandbox.collect()
+
+    def stats(self) -> dict:
+        # в exec нет флага OOMKilled, процесс убивается по SIGKILL
+        return {
+            "oom_killed": self.exit_code == 137
+        }
+
+    def kill(self):
+        self.sandbox.container.kill()
+
+    def destroy(self):
+        if self.sandbox:
+            pool.release(self.sandbox, self.healthy)
+
+    def workspace_path(self) -> str:
+        return self.sandbox.starter_path if self.sandbox else None
+
+
+def find_unshare() -> list:
+    if LOCAL_UNSHARE == "0":
+        return []
+    for prefix in [["unshare", "--net"], ["unshare", "--user", "--map-root-user", "--net"]]:
+        try:
+            if subprocess.run(prefix + ["true"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0:
+                return prefix
+        except OSError:
+            pass
+    logger.info("local sandbox: unshare is not available, network is not isolated")
+    return []
+
+class LocalBackend(Backend):
+    # Процессы на этой машине: рабочий каталог собирается из точек монтирования, как в пуле,
+    # свой TMPDIR, ограничения через rlimit, сеть - через unshare, если доступно.
+    # read_only держится только на правах файлов копий, поэтому только для доверенных программ.
+    name = "local"
+    unshare = None
+
+    def __init__(self, options: dict) -> None:
+        super().__init__(options)
+        self.root = path_join(path_join(workspace_starter(), LOCAL_DIR), str(uuid.uuid4()))
+        self.workspace = Workspace(path_join(self.root, "src"), "local sandbox")
+        self.process = None
+
+    def prepare(self):
+        if LocalBackend.unshare is None:
+            LocalBackend.unshare = find_unshare()
+        os.makedirs(self.workspace.path)
+        os.makedirs(path_join(self.root, "tmp"))
+
+    def materialize(self):
+        self.workspace.materialize(self.options.get(MOUNTS, []))
+
+    def limits(self) -> str:
+        # ограничения ставит bash перед запуском скрипта: preexec_fn в многопоточном сервисе небезопасен
+        limits = ["ulimit -c 0"]
+        mem_limit = parse_size(self.options.get(MEM_LIMIT))
+        if mem_limit:
+            # ограничение сегмента данных ближе к ограничению памяти контейнера, чем -v:
+            # резервирование адресов без записи не учитывается
+            limits.append("ulimit -d " + str(max(1, mem_limit // 1024)))
+        return " && ".join(limits) + " && exec /bin/bash \"$0\""
+
+    def start(self):
+        env = {
+            "PATH": os.environ.get("PATH", "/usr/local/bin:/usr/bin:/bin"),
+            "HOME": self.workspace.path,
+            "TMPDIR": path_join(self.root, "tmp"),
+            "LANG": "C.UTF-8"
+        }
+        self.process = subprocess.Popen(LocalBackend.unshare + ["/bin/bash", "-c", self.limits(), self.options["command"]],
+            cwd=self.workspace.path, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            start_new_session=True)
+        logger.info("local: " + self.options["command"] + ", pid: " + str(self.process.pid))
+
+    def output(self):
+        # длинная строка читается частями
+        return iter(lambda: self.process.stdout.readline(LINE_READ_LIMIT), b"")
+
+    def wait(self) -> int:
+        code = self.process.wait()
+        # как в bash: завершение по сигналу - 128 + номер сигнала
+        return code if code >= 0 else 128 - code
+
+    def collect(self):
+        self.workspace.collect()
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def destroy(self):
+        if self.process:
+            # оставшиеся фоновые процессы группы
+            self.kill()
+            self.process.wait()
+            self.process.stdout.close()
+        taskdir.remove(self.root)
+
+    def workspace_path(self) -> str:
+        return self.workspace.path
+
+
+class FakeBackend(Backend):
+    # Ждет заданное время и печатает вывод того же вида, что настоящие скрипты.
+    # Программы не запускаются, все примеры считаются пройденными.
+    name = "fake"
+
+    def prepare(self):
+        time.sleep(FAKE_CONTAINER_TIME / 2)
+
+    def output(self):
+        # номера примеров берутся из сгенерированного скрипта
+        commands = self.options.get("commands", [])
+        samples = [line for line in commands if line.startswith("echo \"sample: ")]
+        if len(samples) == 0:
+            yield b"debug: build success\n"
+            return
+        usec = int(FAKE_SAMPLE_TIME * 1000000)
+        checker = self.options.get("command", "").startswith("run_checker")
+        for line in samples:
+            yield (line[6:-1] + "\n").encode("utf-8")
+            time.sleep(FAKE_SAMPLE_TIME)
+            if checker:
+                continue
+            for _ in range(FAKE_OUTPUT_LINES):
+                yield b"debug: fake output\n"
+            yield ("mem: 1024;time: " + f"{FAKE_SAMPLE_TIME:.6f}" + ";user: " + str(usec) + ";sys: 0;wall: " + str(usec) + "\n").encode("utf-8")
+
+    def destroy(self):
+        time.sleep(FAKE_CONTAINER_TIME / 2)
+
+
+def create(options: dict) -> Backend:
+    if SANDBOX == "fake":
+        return FakeBackend(options)
+    elif SANDBOX == "local":
+        return LocalBackend(options)
+    elif SANDBOX == "docker":
+        if pool.enabled(options):
+            return PoolBackend(options)
+        return DockerBackend(options)
+    else:
+        raise Exception('Unknown sandbox "' + SANDBOX + '"')
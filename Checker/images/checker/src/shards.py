@@ -0,0 +1,101 @@
+from globals import *
+import threading
+import time
+
+import container
+import checker
+import parsers
+
+logger = log("shards")
+
+class Shard(WrapperInterface):
+    def __init__(self, owner: WrapperInterface, options: dict, indexes: list, name: str) -> None:
+        self.owner = owner
+        self.options = options
+        self.indexes = indexes
+        self.name = name
+        self.parser = parsers.RunParser()
+        self.status = RUNNING
+
+    def set(self, result: dict, status: str = None):
+        if status:
+            self.status = status
+
+    def setStatus(self, status: str):
+        self.status = status
+
+    def get(self):
+        return self.parser.result()
+
+    def parse_line(self, line: str):
+        self.parser.feed(line)
+        self.owner.publish_shards()
+
+    def parse_output(self, status: str):
+        self.status = status
+
+    def add_time(self, stage: str, seconds: float):
+        # время частей складывается, поэтому может превышать длительность фазы
+        self.owner.add_time(stage, seconds)
+
+
+class ShardRunner:
+    def __init__(self, owner: WrapperInterface, options: dict, shards: list) -> None:
+        self.owner = owner
+        self.lock = threading.Lock()
+        self.cancel = threading.Event()
+        self.failed = None
+        self.shards = []
+        k = 1
+        for indexes in shards:
+            shard_options = dict(options)
+            shard_options[MOUNTS] = list(options[MOUNTS])
+            shard_options[CANCEL] = self.cancel
+            name = "_" + str(k)
+            checker.prepare_testee(shard_options, indexes, name)
+            self.shards.append(Shard(owner, shard_options, indexes, name))
+            k += 1
+
+    def run_shard(self, shard: Shard):
+        try:
+            container.run(shard, shard.options)
+        except Exception as e:
+            logger.exception(e)
+            shard.status = EXCEPTION
+            shard.parser.feed(exception_str(e))
+        if shard.status != SUCCESS:
+            self.lock.acquire()
+            try:
+                if self.failed is None:
+                    # первая ошибка останавливает остальные части
+                    self.failed = shard
+                    self.cancel.set()
+            finally:
+                self.lock.release()
+
+    def run(self) -> str:
+        threads = []
+        for shard in self.shards:
+            t = threading.Thread(target=self.run_shard, args=[shard])
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        # освобождает наблюдателей отмены в container.run
+        self.cancel.set()
+
+        for shard in self.shards:
+            if shard.status == SUCCESS:
+                checker.collect_outputs(shard.options, shard.indexes, shard.name)
+        return self.failed.status if self.failed else SUCCESS
+
+    def result(self) -> dict:
+        results = [shard.get() for shard in self.shards]
+        result = parsers.merge_run(results, self.failed.get() if self.failed else None)
+        if not self.failed:
+            # номер последнего запущенного примера в исходной нумерации
+            for shard, r in zip(self.shards, results):
+                started = shard.indexes[:r["run_samples"]]
+                if len(started) > 0:
+                    result["last_sample"] = max(result["last_sample"], max(started))
+        return result
@@ -0,0 +1,105 @@
+from globals import *
+import shutil
+import tempfile
+import threading
+
+import checker
+import taskdir
+
+logger = log("shared")
+
+class SharedChecker:
+    # Примеры и сборка проверки, общие для всех задач пакета.
+    # Примеры записываются один раз, проверку собирает первая дошедшая до сборки задача.
+    # Результатом сборки считаются успех и ошибка компиляции; после тайм-аута, нехватки памяти
+    # и т.п. проверку собирает заново следующая задача.
+    # Сборка идет без self.lock: остальные задачи ждут ее окончания на self.condition
+    # только в своих потоках запуска.
+    KEEP = ["samples"]
+
+    def __init__(self, checker_options: dict, samples: list, members: int) -> None:
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.building = False
+        self.members = members
+        self.built = False
+        self.build_ok = False
+        self.build_status = None
+        self.build_result = None
+        # ключ статистики непройденных примеров, вычисляется один раз на пакет
+        self.stats_key = None
+
+        self.starter_path = tempfile.mkdtemp(prefix="batch", dir=workspace_starter())
+        self.docker_path = path_join(workspace_docker(), os.path.basename(self.starter_path))
+        self.options = dict(checker_options)
+        self.options[STARTER_TEMP] = self.starter_path
+        self.options[DOCKER_TEMP] = self.docker_path
+
+        os.makedirs(path_join(self.starter_path, "samples"))
+        checker.write_samples(path_join(self.starter_path, "samples"), samples)
+        self.samples_dir = path_join(self.docker_path, "samples")
+        logger.info("batch " + self.starter_path + ", members: " + str(members))
+
+    def build_checker(self, task: WrapperInterface, module, options: dict) -> bool:
+        self.lock.acquire()
+        try:
+            self.condition.wait_for(lambda: not self.building)
+            builder = not self.built
+            self.building = builder
+        finally:
+            self.lock.release()
+
+        if builder:
+            build_ok = False
+            try:
+                self.clear_build()
+                build_ok = task.build(module, self.options, CHECKER)
+            finally:
+                self.lock.acquire()
+                try:
+                    self.build_ok = build_ok
+                    self.built = build_ok or task.status == ERROR
+                    if not build_ok:
+                        self.build_status = task.status
+                        self.build_result = dict(task.get())
+                    if self.built:
+                        self.save()
+                    self.building = False
+                    self.condition.notify_all()
+                finally:
+                    self.lock.release()
+
+        if not self.build_ok:
+            if not builder:
+                task.set(dict(self.build_result), self.build_status)
+            return False
+
+        bin_path = self.options["bin_path"]
+        options["bin_path"] = bin_path if os.path.isabs(bin_path) else path_join(self.docker_path, bin_path)
+        options[CMD] = self.options[CMD]
+        return True
+
+    def clear_build(self):
+        # остатки прошлой неудачной сборки: исходник и каталог создаются заново
+        for name in os.listdir(self.starter_path):
+            if name in self.KEEP:
+                continue
+            path = path_join(self.starter_path, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.unlink(path)
+
+    def save(self):
+        pass
+
+    def release(self):
+        self.lock.acquire()
+        try:
+            self.members -= 1
+            if self.members > 0:
+                return
+        finally:
+            self.lock.release()
+        logger.info("batch " + self.starter_path + " done")
+        taskdir.remove(self.starter_path)
@@ -1,98 +1,303 @@
-from data_wrapper import Wrapper
+from data_wrapper import Wrapper, CheckerBuild
+from shared import SharedChecker
+from store import StoredTask
+import metrics
+import problems
+import store
 from globals import *
 from time import sleep
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+import heapq
 import threading
+import time
 import uuid
 
 logger = log("starter")
 logger.info("init")
 
-MAX_CONTAINERS = int(os.environ.get("MAX_CONTAINERS", "4"))
+TASK_TTL = timedelta(days=1)
 
 class Runner:
     def __init__(self) -> None:
-        self.tasks = {}
+        self.store = store.create()
+        self.tasks = {} # задачи в очереди и выполняющиеся
         self.lock = threading.Lock()
+        self.queue = [] # (приоритет, номер, uid)
+        self.queue_size = dict.fromkeys(PRIORITIES, 0)
+        self.expiry = [] # (время устаревания, uid)
+        self.counter = 0
+        self.running = 0
+        self.dispatched = 0
+        self.queue_wait_sum = 0.0
+        self.queue_wait_max = 0.0
 
-    def get(self, uid: str) -> dict:
-        self.lock.acquire()
-        try:
-            return self.tasks.get(uid)
-        finally:
-            self.lock.release()
+    def get(self, uid: str):
+        # чтение словаря атомарно, блокировка планировщика не нужна;
+        # завершенная задача сначала записывается в хранилище, затем убирается из self.tasks
+        task = self.tasks.get(uid)
+        if task is None:
+            record = self.store.get(uid)
+            if record:
+                task = StoredTask(record)
+        return task
 
-    def run_safe(self, task: Wrapper):
+    def run_safe(self, uid: str, task: Wrapper):
         try:
+            self.store.start(uid)
             task.run()
         except Exception as e:
             logger.exception(e)
             task.set({
                 "error": exception_str(e)
             }, EXCEPTION)
+        finally:
+            task.finish()
+            try:
+                result = task.get()
+                self.store.finish(uid, result[STATUS], result, time.time() + TASK_TTL.total_seconds())
+            except Exception as e:
+                logger.exception(e)
+            self.lock.acquire()
+            try:
+                self.tasks.pop(uid, None)
+                self.running -= task.slots
+                self.dispatch()
+            finally:
+                self.lock.release()
 
-    def run_thread(self, task: Wrapper):
-        task.status = RUNNING
-        t = threading.Thread(target=self.run_safe, args=[task])
+    def run_thread(self, uid: str, task: Wrapper):
+        task.setStatus(RUNNING)
+        t = threading.Thread(target=self.run_safe, args=[uid, task])
         t.start()
 
-    def tasks_run(self):
-        cnt = 0
-        for key in self.tasks:
-            task = self.tasks[key]
-            if task.status == RUNNING:
-                cnt += 1
-            pass
-        pass
-        for key in self.tasks:
-            task = self.tasks[key]
-            if task.status == STARTING:
-                if cnt < MAX_CONTAINERS:
-                    self.run_thread(task)
-                    cnt += 1
-                else:
-                    break
-            pass
-        pass
+    def dispatch(self):
+        # вызывается под self.lock
+        while len(self.queue) > 0:
+            _, _, uid = self.queue[0]
+            task = self.tasks.get(uid)
+            if task is None:
+                heapq.heappop(self.queue)
+                continue
+            # задача с частями занимает несколько слотов, обгонять ее нельзя
+            if self.running + task.slots > MAX_CONTAINERS:
+                break
+            heapq.heappop(self.queue)
+            self.queue_size[task.priority] -= 1
 
-    def add(self, input: dict):
-        self.lock.acquire()
-        try:
+            queue_wait = time.monotonic() - task.queued
+            task.queue_wait = queue_wait
+            self.dispatched += 1
+            self.queue_wait_sum += queue_wait
+            self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+            metrics.queue_wait.observe(queue_wait, task.priority)
+
+            self.running += task.slots
+            self.run_thread(uid, task)
+
+    def add_task(self, input: dict, shared: SharedChecker = None, task_class = Wrapper,
+            stored: dict = None, kind: str = store.TASK, uid: str = None) -> str:
+        # вызывается под self.lock; stored - запрос в том виде, в котором он сохраняется для перезапуска
+        task = task_class(input, shared)
+        task.priority = input.get(PRIORITY, DEFAULT_PRIORITY)
+        task.queued = time.monotonic()
+        task.slots = max(1, min(input.get(SHARDS, 1), MAX_CONTAINERS, len(input[SAMPLES])))
+
+        if uid is None:
             uid = str(uuid.uuid4())
+            self.store.add(uid, kind, task.priority, input if stored is None else stored,
+                time.time() + TASK_TTL.total_seconds())
+        self.tasks[uid] = task
 
-            self.tasks[uid] = Wrapper(input)
+        self.counter += 1
+        heapq.heappush(self.queue, (PRIORITIES[task.priority], self.counter, uid))
+        self.queue_size[task.priority] += 1
+        heapq.heappush(self.expiry, (task.created + TASK_TTL, uid))
+        return uid
 
-            self.tasks_run()
+    def add(self, input: dict, uid: str = None):
+        stored = input
+        shared = None
+        if PROBLEM in input:
+            shared = problems.get(input[PROBLEM])
+            input = shared.submission(input)
+        self.lock.acquire()
+        try:
+            uid = self.add_task(input, shared, stored=stored, uid=uid)
+            self.dispatch()
             return uid
         finally:
             self.lock.release()
 
-    def wait(self):
-        while True:
+    def add_batch(self, input: dict) -> list:
+        testees = input[TESTEES]
+        shared = SharedChecker(input[CHECKER], input[SAMPLES], len(testees))
+        self.lock.acquire()
+        try:
+            uids = []
+            for testee in testees:
+                member = dict(input)
+                del member[TESTEES]
+                member[TESTEE] = dict(testee)
+                member[CHECKER] = dict(input[CHECKER])
+                # после перезапуска участник пакета выполняется как отдельная задача
+                uids.append(self.add_task(member, shared))
+            self.dispatch()
+            return uids
+        finally:
+            self.lock.release()
+
+    def add_problem(self, input: dict) -> dict:
+        problem, created = problems.register(input)
+        result = problem.info()
+        if (created or not problem.built) and not COMPARE in problem.options:
+            # проверка собирается заранее, как обычная задача в очереди;
+            # повторная регистрация задачи без собранной проверки запускает сборку снова
             self.lock.acquire()
             try:
-                # clear old tasks
-                new_tasks = {}
-                for key in self.tasks:
-                    task = self.tasks[key]
-                    if (datetime.now() - task.created).days < 1:
-                        new_tasks[key] = task
-                self.tasks = new_tasks
-
-                self.tasks_run()
+                result[BUILD] = self.add_build(problem, input.get(PRIORITY, DEFAULT_PRIORITY))
+                self.dispatch()
             finally:
                 self.lock.release()
-            sleep(1)
+        return result
+
+    def add_build(self, problem, priority: str, uid: str = None) -> str:
+        # вызывается под self.lock
+        return self.add_task({
+            CHECKER: {
+                LANGUAGE: problem.options[LANGUAGE],
+                SOURCE: problem.options[SOURCE]
+            },
+            SAMPLES: [],
+            PRIORITY: priority
+        }, problem, CheckerBuild, {
+            PROBLEM: problem.uid,
+            PRIORITY: priority
+        }, store.CHECKER_BUILD, uid)
+
+    def resume(self):
+        # задачи, не завершенные до перезапуска, ставятся в очередь заново
+        records = self.store.pending()
+        for record in records:
+            uid = record[UID]
+            input = record["input"]
+            try:
+                if record["kind"] == store.CHECKER_BUILD:
+                    problem = problems.get(input[PROBLEM])
+                    if problem is None:
+                        raise Exception("Problem " + input[PROBLEM] + " not found")
+                    self.lock.acquire()
+                    try:
+                        self.add_build(problem, input[PRIORITY], uid)
+                    finally:
+                        self.lock.release()
+                else:
+                    if PROBLEM in input and problems.get(input[PROBLEM]) is None:
+                        raise Exception("Problem " + input[PROBLEM] + " not found")
+                    self.add(input, uid)
+            except Exception as e:
+                logger.exception(e)
+                self.store.finish(uid, EXCEPTION, {
+                    STATUS: EXCEPTION,
+                    "error": exception_str(e),
+                    "done": True
+                }, time.time() + TASK_TTL.total_seconds())
+        if len(records) > 0:
+            logger.info("resumed: " + str(len(records)))
+        self.lock.acquire()
+        try:
+            self.dispatch()
+        finally:
+            self.lock.release()
+
+    def expire(self) -> float:
+        # возвращает, сколько секунд ждать до следующей проверки
+        self.lock.acquire()
+        try:
+            now = datetime.now()
+            while len(self.expiry) > 0 and self.expiry[0][0] <= now:
+                _, uid = heapq.heappop(self.expiry)
+                task = self.tasks.get(uid)
+                if task is None:
+                    continue
+                expires = task.created + TASK_TTL
+                if expires > now:
+                    # задача обновлялась после постановки в очередь
+                    heapq.heappush(self.expiry, (expires, uid))
+                else:
+                    del self.tasks[uid]
+                    if task.status == STARTING:
+                        self.queue_size[task.priority] -= 1
+                        if task.shared:
+                            task.shared.release()
+
+            if len(self.expiry) == 0:
+                wait = TASK_TTL.total_seconds()
+            else:
+                wait = (self.expiry[0][0] - now).total_seconds()
+        finally:
+            self.lock.release()
+
+        # завершенные задачи удаляются по индексу времени устаревания
+        deleted = self.store.expire(time.time())
+        if deleted > 0:
+            logger.info("expired: " + str(deleted))
+        return wait
+
+    def stats(self) -> dict:
+        self.lock.acquire()
+        try:
+            return {
+                "running": self.running,
+                "max_containers": MAX_CONTAINERS,
+                "queue": dict(self.queue_size),
+                "tasks": len(self.tasks),
+                "dispatched": self.dispatched,
+                "queue_wait_avg": self.queue_wait_sum / self.dispatched if self.dispatched > 0 else 0,
+                "queue_wait_max": self.queue_wait_max
+            }
+        finally:
+            self.lock.release()
+
+    def tasks_by_status(self) -> dict:
+        # без self.lock: копия списка задач и чтение полей атомарны
+        result = {}
+        for task in list(self.tasks.values()):
+            status = task.status_prefix + task.status
+            result[(status,)] = result.get((status,), 0) + 1
+        return result
+
+    def wait(self):
+        while True:
+            sleep(min(max(self.expire(), 1), 60))
         pass
 
 
 runner = Runner()
-t = threading.Thread(target=runner.wait)
+metrics.Gauge("checker_tasks", "Queued and running tasks by status", ["status"], runner.tasks_by_status)
+metrics.Gauge("checker_queue_depth", "Queued tasks by priority", ["priority"],
+    lambda: {(priority,): size for priority, size in dict(runner.queue_size).items()})
+metrics.Gauge("checker_slots", "Container slots in use and available", ["state"],
+    lambda: {("running",): runner.running, ("max",): MAX_CONTAINERS})
+runner.resume()
+t = threading.Thread(target=runner.wait, daemon=True)
 t.start()
 
 def task_add(input: dict) -> str:
     return runner.add(input)
 
+def task_add_batch(input: dict) -> list:
+    return runner.add_batch(input)
+
+def problem_add(input: dict) -> dict:
+    return runner.add_problem(input)
+
+def problem_get(uid: str) -> dict:
+    problem = problems.get(uid)
+    return None if problem is None else problem.info()
+
 def task_get(uid: str) -> dict:
-    return runner.get(uid)
\ No newline at end of file
+    return runner.get(uid)
+
+def scheduler_stats() -> dict:
+    return runner.stats()
@@ -0,0 +1,184 @@
+from globals import *
+import json
+import sqlite3
+import threading
+import time
+
+logger = log("store")
+
+# Хранилище задач: "sqlite" (по умолчанию) или "memory"
+TASK_STORE = os.environ.get("TASK_STORE", "sqlite")
+TASK_STORE_PATH = os.environ.get("TASK_STORE_PATH") or path_join(starter_temp(), "tasks.db")
+
+# Виды задач
+TASK = "task"
+CHECKER_BUILD = "checker_build"
+
+class StoredTask:
+    # завершенная задача, прочитанная из хранилища
+    def __init__(self, record: dict) -> None:
+        self.record = record
+
+    def get(self) -> dict:
+        return self.record[RESULT]
+
+    def etag(self) -> str:
+        # результат завершенной задачи больше не меняется
+        return "done"
+
+    def wait_status(self, status: str, timeout: float):
+        pass
+
+    def wait_changes(self, version: int, timeout: float) -> tuple:
+        result = self.get()
+        progress = {
+            "run_samples": result.get("run_samples", 0),
+            "last_sample": result.get("last_sample", 0)
+        }
+        return 1, [result.get(STATUS)], progress, True
+
+
+class MemoryStore:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.tasks = {}
+
+    def add(self, uid: str, kind: str, priority: str, input: dict, expires: float):
+        self.lock.acquire()
+        try:
+            self.tasks[uid] = {
+                UID: uid,
+                "kind": kind,
+                PRIORITY: priority,
+                STATUS: STARTING,
+                "input": input,
+                RESULT: None,
+                "created": time.time(),
+                "expires": expires
+            }
+        finally:
+            self.lock.release()
+
+    def start(self, uid: str):
+        self.lock.acquire()
+        try:
+            record = self.tasks.get(uid)
+            if record:
+                record[STATUS] = RUNNING
+        finally:
+            self.lock.release()
+
+    def finish(self, uid: str, status: str, result: dict, expires: float):
+        self.lock.acquire()
+        try:
+            record = self.tasks.get(uid)
+            if record:
+                record[STATUS] = status
+                record[RESULT] = json.loads(json.dumps(result, default=str))
+                record["input"] = None
+                record["expires"] = expires
+        finally:
+            self.lock.release()
+
+    def get(self, uid: str) -> dict:
+        self.lock.acquire()
+        try:
+            record = self.tasks.get(uid)
+            return dict(record) if record and record[RESULT] is not None else None
+        finally:
+            self.lock.release()
+
+    def pending(self) -> list:
+        self.lock.acquire()
+        try:
+            records = [dict(r) for r in self.tasks.values() if r[STATUS] in [STARTING, RUNNING]]
+            records.sort(key=lambda r: r["created"])
+            return records
+        finally:
+            self.lock.release()
+
+    def expire(self, now: float) -> int:
+        self.lock.acquire()
+        try:
+            expired = [uid for uid, r in self.tasks.items() if r["expires"] < now]
+            for uid in expired:
+                del self.tasks[uid]
+            return len(expired)
+        finally:
+            self.lock.release()
+
+
+class SQLiteStore:
+    def __init__(self, path: str) -> None:
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                uid TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                status TEXT NOT NULL,
+                input TEXT,
+                result TEXT,
+                created REAL NOT NULL,
+                expires REAL NOT NULL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tasks_expires ON tasks (expires)")
+        logger.info("sqlite " + path)
+
+    def execute(self, sql: str, args: tuple = ()) -> list:
+        self.lock.acquire()
+        try:
+            return self.db.execute(sql, args).fetchall()
+        finally:
+            self.lock.release()
+
+    def add(self, uid: str, kind: str, priority: str, input: dict, expires: float):
+        self.execute("INSERT INTO tasks (uid, kind, priority, status, input, created, expires) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (uid, kind, priority, STARTING, json.dumps(input), time.time(), expires))
+
+    def start(self, uid: str):
+        self.execute("UPDATE tasks SET status = ? WHERE uid = ?", (RUNNING, uid))
+
+    def finish(self, uid: str, status: str, result: dict, expires: float):
+        self.execute("UPDATE tasks SET status = ?, result = ?, input = NULL, expires = ? WHERE uid = ?",
+            (status, json.dumps(result, default=str), expires, uid))
+
+    def get(self, uid: str) -> dict:
+        rows = self.execute("SELECT status, result FROM tasks WHERE uid = ? AND result IS NOT NULL", (uid,))
+        if len(rows) == 0:
+            return None
+        return {
+            UID: uid,
+            STATUS: rows[0][0],
+            RESULT: json.loads(rows[0][1])
+        }
+
+    def pending(self) -> list:
+        rows = self.execute("SELECT uid, kind, priority, status, input FROM tasks WHERE status IN (?, ?) ORDER BY created", (STARTING, RUNNING))
+        return [{
+            UID: row[0],
+            "kind": row[1],
+            PRIORITY: row[2],
+            STATUS: row[3],
+            "input": json.loads(row[4])
+        } for row in rows]
+
+    def expire(self, now: float) -> int:
+        self.lock.acquire()
+        try:
+            return self.db.execute("DELETE FROM tasks WHERE expires < ?", (now,)).rowcount
+        finally:
+            self.lock.release()
+
+
+def create():
+    if TASK_STORE == "memory":
+        return MemoryStore()
+    elif TASK_STORE == "sqlite":
+        return SQLiteStore(TASK_STORE_PATH)
+    else:
+        raise Exception('Unknown task store "' + TASK_STORE + '"')
@@ -0,0 +1,163 @@
+from globals import *
+from workspace import clear_dir
+import samplestore
+import queue
+import shutil
+import stat
+import tempfile
+import threading
+import uuid
+
+logger = log("taskdir")
+
+# Каталоги задач лежат в WORKSPACE_STARTER (для docker - WORKSPACE_DOCKER), это может быть
+# tmpfs с ограничением размера. Квоты на байты и файлы одной задачи проверяются во время
+# фаз и после них; превышение дает статус workspace_limit. 0 - без ограничения.
+WORKSPACE_BYTES = parse_size(os.environ.get("WORKSPACE_BYTES", "0"))
+WORKSPACE_INODES = int(os.environ.get("WORKSPACE_INODES", "0"))
+# Как часто проверять квоты во время фазы, секунды
+WORKSPACE_CHECK_INTERVAL = float(os.environ.get("WORKSPACE_CHECK_INTERVAL", "0.5"))
+
+# Каталоги, ожидающие удаления фоновым потоком
+REAP_PREFIX = ".reap-"
+
+def enabled() -> bool:
+    return WORKSPACE_BYTES > 0 or WORKSPACE_INODES > 0
+
+def usage(path: str) -> tuple:
+    # (байты, файлы и каталоги); обход прекращается, как только квота превышена.
+    # В байты не входят только жесткие ссылки на файлы хранилища примеров.
+    size = 0
+    inodes = 0
+    seen = set()
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            inodes += 1
+            if stat.S_ISDIR(st.st_mode):
+                stack.append(entry.path)
+            elif not (st.st_nlink > 1 and samplestore.shared(st)):
+                size += st.st_size
+            if exceeded(size, inodes):
+                return size, inodes
+    return size, inodes
+
+def exceeded(size: int, inodes: int) -> bool:
+    return (WORKSPACE_BYTES > 0 and size > WORKSPACE_BYTES) or (WORKSPACE_INODES > 0 and inodes > WORKSPACE_INODES)
+
+def check(path: str) -> str:
+    # None, если квоты не превышены, иначе сообщение для вывода задачи
+    if not enabled():
+        return None
+    size, inodes = usage(path)
+    if not exceeded(size, inodes):
+        return None
+    return "workspace limit exceeded: " + str(size) + " bytes (limit " + str(WORKSPACE_BYTES) + "), " \
+        + str(inodes) + " files (limit " + str(WORKSPACE_INODES) + ")"
+
+
+class Watcher:
+    # проверяет квоты каталогов во время фазы и останавливает песочницу при превышении
+    def __init__(self, paths: list, kill) -> None:
+        self.paths = [path for path in paths if path]
+        self.kill = kill
+        self.message = None
+        self.finished = threading.Event()
+        if enabled() and len(self.paths) > 0:
+            threading.Thread(target=self.watch, daemon=True).start()
+
+    def watch(self):
+        while not self.finished.wait(WORKSPACE_CHECK_INTERVAL):
+            for path in self.paths:
+                message = check(path)
+                if message:
+                    self.message = message
+                    try:
+                        self.kill()
+                    except Exception as e:
+                        logger.warning("workspace limit: " + str(e))
+                    return
+
+    def stop(self, path: str) -> str:
+        # останавливает проверку и проверяет каталог после фазы
+        self.finished.set()
+        if self.message is None and path:
+            self.message = check(path)
+        return self.message
+
+
+class Reaper:
+    # удаление каталогов в фоне: каталог сразу переименовывается и больше не мешает задаче
+    def __init__(self) -> None:
+        self.queue = queue.Queue()
+
+    def remove(self, path: str):
+        if path is None or not os.path.exists(path):
+            return
+        trash = path_join(workspace_starter(), REAP_PREFIX + str(uuid.uuid4()))
+        try:
+            os.rename(path, trash)
+        except OSError:
+            trash = path
+        self.queue.put(trash)
+
+    def delete(self, path: str):
+        try:
+            clear_dir(path)
+            os.rmdir(path)
+        except Exception as e:
+            logger.warning("reaper: " + str(e))
+            shutil.rmtree(path, ignore_errors=True)
+
+    def recover(self, root: str):
+        # каталоги, не удаленные до перезапуска
+        if not os.path.isdir(root):
+            return
+        for name in os.listdir(root):
+            if name.startswith(REAP_PREFIX):
+                self.queue.put(path_join(root, name))
+
+    def wait(self):
+        while True:
+            path = self.queue.get()
+            self.delete(path)
+
+
+class TemporaryDirectory:
+    # каталог задачи: создается в корне каталогов задач, удаляется в фоне
+    def __init__(self, data: dict) -> None:
+        self.data = data
+        data[DOCKER_TEMP] = workspace_docker()
+        data[STARTER_TEMP] = workspace_starter()
+        self.path = None
+
+    def __enter__(self):
+        self.path = tempfile.mkdtemp(dir=self.data[STARTER_TEMP])
+        temp_name = os.path.basename(self.path)
+        self.data[STARTER_TEMP] = path_join(self.data[STARTER_TEMP], temp_name)
+        self.data[DOCKER_TEMP] = path_join(self.data[DOCKER_TEMP], temp_name)
+        return None
+
+    def __exit__(self, exc, value, tb):
+        reaper.remove(self.path)
+
+
+def remove(path: str):
+    reaper.remove(path)
+
+os.makedirs(workspace_starter(), exist_ok=True)
+reaper = Reaper()
+reaper.recover(workspace_starter())
+t = threading.Thread(target=reaper.wait, daemon=True)
+t.start()
@@ -0,0 +1,145 @@
+from globals import *
+import shutil
+import stat
+
+# Рабочий каталог песочницы без bind-монтирования: содержимое точек монтирования
+# фазы переносится в каталог жесткими ссылками или копированием,
+# а изменения записываемого /usr/src после фазы возвращаются обратно.
+WORKDIR = "/usr/src"
+
+def host_path(source: str) -> str:
+    # пути монтирования заданы для docker, а сервис видит их в STARTER_TEMP или WORKSPACE_STARTER
+    for root, host in [(workspace_docker(), workspace_starter()), (docker_temp(), starter_temp())]:
+        if source == root or source.startswith(root.rstrip("/") + "/"):
+            return host + source[len(root):]
+    return source
+
+def link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def copy_entry(src: str, dst: str, link: bool):
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+    elif os.path.isdir(src):
+        shutil.copytree(src, dst, symlinks=True, copy_function=link_or_copy if link else shutil.copy2)
+    elif link:
+        link_or_copy(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+def make_read_only(path: str):
+    if os.path.islink(path):
+        return
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                full = os.path.join(root, name)
+                if not os.path.islink(full):
+                    os.chmod(full, os.stat(full).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        for root, dirs, files in os.walk(path, topdown=False):
+            os.chmod(root, 0o555)
+    else:
+        os.chmod(path, os.stat(path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+def snapshot(path: str, skip: set) -> dict:
+    result = {}
+    for root, dirs, files in os.walk(path):
+        rel_root = os.path.relpath(root, path).replace("\\", "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        links = [d for d in dirs if os.path.islink(os.path.join(root, d))]
+        dirs[:] = [d for d in dirs if not d in links and not (rel_root + d) in skip]
+        for name in files + links:
+            rel = rel_root + name
+            if rel in skip:
+                continue
+            st = os.lstat(os.path.join(root, name))
+            result[rel] = (st.st_ino, st.st_size, st.st_mtime_ns)
+    return result
+
+def clear_dir(path: str):
+    for name in os.listdir(path):
+        full = path_join(path, name)
+        if os.path.isdir(full) and not os.path.islink(full):
+            for root, dirs, files in os.walk(full):
+                for d in dirs:
+                    os.chmod(os.path.join(root, d), 0o755)
+            os.chmod(full, 0o755)
+            shutil.rmtree(full)
+        else:
+            os.unlink(full)
+
+
+class Workspace:
+    def __init__(self, path: str, owner: str) -> None:
+        self.path = path
+        self.owner = owner
+        self.base = None
+        self.base_snapshot = {}
+        self.skip = set()
+
+    def materialize(self, mounts: list):
+        prefix = WORKDIR + "/"
+        self.base = None
+        self.skip = set()
+        for mount in mounts:
+            target = mount["Target"]
+            if target == WORKDIR:
+                if not mount["ReadOnly"]:
+                    self.base = host_path(mount["Source"])
+            elif target.startswith(prefix):
+                self.skip.add(target[len(prefix):])
+            else:
+                raise Exception("Mount " + target + " is not supported by " + self.owner)
+
+        for mount in mounts:
+            source = host_path(mount["Source"])
+            target = mount["Target"]
+            if target == WORKDIR:
+                for name in os.listdir(source):
+                    if name in self.skip:
+                        continue
+                    # для записываемого каталога жесткие ссылки дают ту же семантику, что и bind
+                    copy_entry(path_join(source, name), path_join(self.path, name), not mount["ReadOnly"])
+                    if mount["ReadOnly"]:
+                        make_read_only(path_join(self.path, name))
+            else:
+                dst = path_join(self.path, target[len(prefix):])
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                # только для чтения - копия: права файлов не мешают писать root,
+                # а жесткая ссылка на хранилище примеров изменила бы его для всех задач
+                copy_entry(source, dst, not mount["ReadOnly"])
+                if mount["ReadOnly"]:
+                    make_read_only(dst)
+
+        self.base_snapshot = snapshot(self.path, self.skip) if self.base else {}
+
+    def collect(self):
+        if not self.base:
+            return
+        after = snapshot(self.path, self.skip)
+        for rel, state in after.items():
+            if self.base_snapshot.get(rel) == state:
+                continue
+            src = path_join(self.path, rel)
+            if not os.path.islink(src) and not os.path.isfile(src):
+                # каналы, сокеты и устройства, созданные программой, не переносятся
+                continue
+            dst = path_join(self.base, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.lexists(dst) and not os.path.isdir(dst):
+                os.unlink(dst)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+            else:
+                shutil.copy2(src, dst)
+        for rel in self.base_snapshot:
+            if not rel in after:
+                dst = path_join(self.base, rel)
+                if os.path.lexists(dst) and not os.path.isdir(dst):
+                    os.unlink(dst)
+
+    def clear(self):
+        clear_dir(self.path)
@@ -0,0 +1,8 @@
+#!/bin/bash
+# Прогрев песочницы сборки из пула: запускает резидентные MSBuild и VBCSCompiler
+for t in cs vb; do
+  rm -rf /tmp/warmup_$t
+  cp -r /opt/templates/$t /tmp/warmup_$t
+  dotnet build --configuration Release --no-restore -v q /tmp/warmup_$t
+  rm -rf /tmp/warmup_$t
+done
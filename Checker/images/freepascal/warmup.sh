@@ -0,0 +1,6 @@
+#!/bin/bash
+# Прогрев песочницы сборки из пула: компилятор и модули RTL попадают в кэш страниц
+cd /tmp
+printf 'program warmup;\nbegin\nend.\n' > warmup.pas
+fpc -owarmup warmup.pas
+rm -f warmup warmup.o warmup.pas
@@ -0,0 +1,8 @@
+#!/bin/bash
+# Прогрев песочницы сборки из пула: компилятор и заголовки попадают в кэш страниц
+cd /tmp
+printf '#include <stdio.h>\nint main() { return 0; }\n' > warmup.c
+printf '#include <bits/stdc++.h>\nint main() { return 0; }\n' > warmup.cpp
+gcc -o warmup warmup.c
+g++ -o warmup warmup.cpp
+rm -f warmup warmup.c warmup.cpp
@@ -0,0 +1,64 @@
+import json
+import random
+import requests
+import sys
+import time
+
+# Сравнение N отдельных POST / с одним POST /batch на тех же примерах и проверке
+URL = "http://localhost:3356"
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+def make_samples() -> list:
+    samples = []
+    for i in range(1, 10):
+        samples.append(str(random.randint(1, 1000)) + " " + str(random.randint(1, 1000)))
+    return samples
+
+def test(lang: str, filename: str) -> dict:
+    data = {
+        "language": lang,
+        "timeout": 2,
+        "mem_limit": "100m"
+    }
+    with open(filename, "r") as f:
+        data["source"] = f.read()
+
+    return data
+
+def wait(uids: list) -> float:
+    for uid in uids:
+        status = ""
+        while True:
+            r = requests.get(URL + "/result/" + uid, params={"wait": 30, "status": status})
+            result = json.loads(r.text)
+            status = result["status"]
+            if result["done"]:
+                break
+    return time.perf_counter()
+
+testee = test("c++", "c/testee.c")
+checker = test("c", "c/checker.c")
+samples = make_samples()
+
+start = time.perf_counter()
+uids = []
+for i in range(N):
+    r = requests.post(URL, data=json.dumps({
+        "testee": testee,
+        "checker": checker,
+        "samples": samples
+    }))
+    uids.append(r.text)
+single = wait(uids) - start
+
+start = time.perf_counter()
+r = requests.post(URL + "/batch", data=json.dumps({
+    "testees": [testee] * N,
+    "checker": checker,
+    "samples": samples
+}))
+batch = wait(json.loads(r.text)) - start
+
+print("submissions:", N)
+print("single: " + f"{single:.2f}" + "s, " + f"{N / single:.2f}" + " per second")
+print("batch:  " + f"{batch:.2f}" + "s, " + f"{N / batch:.2f}" + " per second")
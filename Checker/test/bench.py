@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import random
+import requests
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Нагрузочный тест HTTP API проверки.
+# Пример: python bench.py --requests 200 --concurrency 16 --languages c++:3,py:1 --output run.json
+# С --sandbox fake|local запускает сервис локально с поддельной песочницей или процессами
+# на этой машине (SANDBOX=fake|local), Docker не нужен. --fake - то же, что --sandbox fake.
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(DIR, "..", "images", "checker", "src")
+
+SOURCES = {
+    "c": "c/testee.c",
+    "c++": "c/testee.c",
+    "py": "py/test_summa_user.py",
+    "js": "js/summa.js",
+    "pas": "pas/summa.pas",
+    "C#": "cs/summa_user.cs"
+}
+CHECKER = ("py", "py/test_summa_check.py")
+
+def source(lang: str, filename: str, timeout: float) -> dict:
+    with open(os.path.join(DIR, filename), "r") as f:
+        return {
+            "language": lang,
+            "source": f.read(),
+            "timeout": timeout,
+            "mem_limit": "100m"
+        }
+
+def make_samples(count: int, size: int) -> list:
+    # первая строка - слагаемые, остальное - заполнение до size байт
+    samples = []
+    for i in range(count):
+        sample = str(random.randint(1, 1000)) + " " + str(random.randint(1, 1000))
+        if size > len(sample):
+            sample += "\n" + "0" * (size - len(sample) - 1)
+        samples.append(sample)
+    return samples
+
+def parse_mix(mix: str) -> list:
+    # "c++:3,py:1" -> ["c++", "c++", "c++", "py"]
+    result = []
+    for item in mix.split(","):
+        lang, _, weight = item.partition(":")
+        if not lang in SOURCES:
+            raise ValueError("unknown language " + lang + ", expected one of: " + ", ".join(SOURCES))
+        result += [lang] * int(weight or "1")
+    return result
+
+def percentile(values: list, p: float) -> float:
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[k]
+
+def summary(values: list) -> dict:
+    return {
+        "min": min(values) if values else None,
+        "avg": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None
+    }
+
+def wait_result(session: requests.Session, url: str, uid: str) -> dict:
+    status = ""
+    while True:
+        r = session.get(url + "/result/" + uid, params={"wait": 30, "status": status})
+        result = json.loads(r.text)
+        status = result["status"]
+        if result.get("done"):
+            return result
+
+def worker(args, languages: list, samples: list, jobs: list, results: list, lock: threading.Lock):
+    session = requests.Session()
+    while True:
+        lock.acquire()
+        try:
+            if len(jobs) == 0:
+                return
+            lang = jobs.pop()
+        finally:
+            lock.release()
+
+        data = {
+            "testee": languages[lang],
+            "checker": languages[None],
+            "samples": samples,
+            "priority": args.priority,
+            "shards": args.shards
+        }
+        start = time.perf_counter()
+        try:
+            r = session.post(args.url, data=json.dumps(data))
+            if r.status_code != 200:
+                raise Exception(str(r.status_code) + " " + r.text)
+            result = wait_result(session, args.url, r.text)
+            item = {
+                "language": lang,
+                "latency": time.perf_counter() - start,
+                "queue_wait": result.get("queue_wait"),
+                "status": result["status"]
+            }
+        except Exception as e:
+            item = {
+                "language": lang,
+                "latency": time.perf_counter() - start,
+                "queue_wait": None,
+                "status": "request_error: " + str(e)
+            }
+        lock.acquire()
+        try:
+            results.append(item)
+        finally:
+            lock.release()
+
+def start_server(args) -> subprocess.Popen:
+    temp = tempfile.mkdtemp(prefix="bench")
+    env = dict(os.environ)
+    env.update({
+        "SANDBOX": args.sandbox,
+        "STARTER_TEMP": temp,
+        "DOCKER_TEMP": temp,
+        "TASK_STORE": "memory",
+        "MAX_CONTAINERS": str(args.max_containers)
+    })
+    server = subprocess.Popen([sys.executable, "main.py"], cwd=SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    server.temp = temp
+    for _ in range(100):
+        if server.poll() is not None:
+            raise Exception("server exited with code " + str(server.returncode) + ", is port 3356 busy?")
+        try:
+            requests.get(args.url + "/scheduler", timeout=1)
+            return server
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise Exception("server did not start")
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Checker load benchmark")
+    parser.add_argument("--url", default="http://localhost:3356")
+    parser.add_argument("--requests", type=int, default=100, help="number of submissions")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel clients")
+    parser.add_argument("--languages", default="c++", help="language mix, e.g. c++:3,py:1")
+    parser.add_argument("--samples", type=int, default=10, help="samples per submission")
+    parser.add_argument("--sample-size", type=int, default=0, help="bytes per sample")
+    parser.add_argument("--timeout", type=float, default=2)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--priority", default="practice")
+    parser.add_argument("--sandbox", choices=["fake", "local"], help="start a local server with this SANDBOX")
+    parser.add_argument("--fake", action="store_true", help="same as --sandbox fake")
+    parser.add_argument("--max-containers", type=int, default=4, help="MAX_CONTAINERS for the local server")
+    parser.add_argument("--label", default="", help="free text saved with the results")
+    parser.add_argument("--output", help="save results as JSON")
+    args = parser.parse_args()
+    if args.fake:
+        args.sandbox = "fake"
+
+    mix = parse_mix(args.languages)
+    languages = {lang: source(lang, SOURCES[lang], args.timeout) for lang in set(mix)}
+    languages[None] = source(CHECKER[0], CHECKER[1], args.timeout)
+    samples = make_samples(args.samples, args.sample_size)
+    jobs = [random.choice(mix) for _ in range(args.requests)]
+
+    server = start_server(args) if args.sandbox else None
+    try:
+        results = []
+        lock = threading.Lock()
+        threads = [threading.Thread(target=worker, args=[args, languages, samples, jobs, results, lock]) for _ in range(args.concurrency)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        scheduler = json.loads(requests.get(args.url + "/scheduler").text)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(server.temp, ignore_errors=True)
+
+    statuses = {}
+    for item in results:
+        statuses[item["status"]] = statuses.get(item["status"], 0) + 1
+    report = {
+        "label": args.label,
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "languages": args.languages,
+            "samples": args.samples,
+            "sample_size": args.sample_size,
+            "shards": args.shards,
+            "priority": args.priority,
+            "sandbox": args.sandbox
+        },
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed,
+        "latency": summary([item["latency"] for item in results]),
+        "queue_wait": summary([item["queue_wait"] for item in results if item["queue_wait"] is not None]),
+        "statuses": statuses,
+        "scheduler": scheduler
+    }
+
+    print("submissions: " + str(len(results)) + ", elapsed: " + f"{elapsed:.2f}" + "s, throughput: " + f"{report['throughput']:.2f}" + "/s")
+    for name in ["latency", "queue_wait"]:
+        s = report[name]
+        if s["p50"] is not None:
+            print(name + ": p50 " + f"{s['p50']:.3f}" + "s, p95 " + f"{s['p95']:.3f}" + "s, p99 " + f"{s['p99']:.3f}" + "s")
+    print("statuses: " + json.dumps(statuses))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+main()